@@ -90,6 +90,8 @@ class AntMem:
 
 # =====================================================================
 class AntStrategy_smart(AntStrategy):
+    perception_fields = ("visible_cells", "food_pheromone", "home_pheromone")
+
     def __init__(self):
         self.mem: Dict[int, AntMem] = {}
         self.prev: Dict[int, AntAction] = {}
@@ -102,9 +104,9 @@ class AntStrategy_smart(AntStrategy):
         return None
 
     def _grad_dir(self, p: AntPerception, home: bool) -> Optional[Direction]:
-        ph = p.home_pheromone if home else p.food_pheromone
-        if not ph: return None
-        (dx, dy), s = max(ph.items(), key=lambda kv: kv[1])
+        strongest = p.get_strongest_pheromone(home)
+        if strongest is None: return None
+        (dx, dy), s = strongest
         if s < 0.0005: return None
         return DELTA2DIR.get((dx, dy))
 
@@ -123,7 +125,7 @@ class AntStrategy_smart(AntStrategy):
 
         st.integrate(p)
 
-        if not self.food_seen and any(t == TerrainType.FOOD for t in p.visible_cells.values()):
+        if not self.food_seen and p.can_see_food():
             self.food_seen = True
 
         #PICK/DROP
@@ -1,9 +1,26 @@
 from abc import ABC, abstractmethod
+from array import array
+from typing import Optional
+import numpy as np
 from common import Direction, AntPerception, AntAction
 
 
 # Strategy interface for ant behavior
 class AntStrategy(ABC):
+    # Perception fields the strategy reads, any of visible_cells, food_pheromone,
+    # home_pheromone and nearby_ants. None means all of them; fields left out
+    # are given to decide_action empty and are not computed.
+    perception_fields = None
+    # Whether the strategy looks at the vision cone, or only at the ant's own
+    # cell ((0, 0) in visible_cells)
+    perception_cone = True
+    # Optional decide_actions(batch) method deciding for many ants at once.
+    # With batch perception, the ants sharing the strategy instance are passed
+    # together as a perception.StrategyBatch, and it returns one AntAction
+    # value per ant in batch order. Left as None, decide_action is called for
+    # each ant instead.
+    decide_actions = None
+
     @abstractmethod
     def decide_action(self, perception: AntPerception) -> AntAction:
         """Decide the action of an ant based on its perception"""
@@ -13,9 +30,161 @@ class AntStrategy(ABC):
         """Get strategy name"""
         return self.__class__.__name__
 
+    def pop_ant_state(self, ant_id: int):
+        """
+        Remove and return what the strategy remembers about an ant, so the ant
+        can carry it to a strategy copy in another process. None if nothing.
+        """
+        return None
+
+    def push_ant_state(self, ant_id: int, state) -> None:
+        """Take over the state pop_ant_state returned for an ant"""
+        pass
+
+
+# Direction members by value, for converting stored direction codes
+DIRECTIONS = tuple(Direction)
+
+
+class AntPopulation:
+    """
+    State of a group of ants stored as parallel typed arrays, one row per ant.
+
+    Each name in COLUMNS is an attribute holding a NumPy array of length
+    size, so engine code can update all ants with whole-array operations.
+    The arrays are views over array.array buffers, which Ant objects index
+    directly since that is much faster than indexing NumPy arrays one item
+    at a time. Buffers are replaced when the population grows, so keep a
+    reference to the population rather than to its arrays across append().
+    """
+
+    # Column typecodes for the array module and NumPy dtypes
+    COLUMNS = {
+        "x": ("q", np.int64),
+        "y": ("q", np.int64),
+        "direction": ("b", np.int8),
+        "has_food": ("b", np.bool_),
+        "home_pheromone": ("d", np.float64),
+        "food_pheromone": ("d", np.float64),
+        "pheromone_decrease_rate": ("d", np.float64),
+        "food_collected": ("q", np.int64),
+        "steps_taken": ("q", np.int64),
+    }
+    # Values of a new ant besides its position and direction
+    DEFAULTS = {
+        "has_food": False,
+        "home_pheromone": 100.0,
+        "food_pheromone": 100.0,
+        "pheromone_decrease_rate": 0.995,
+        "food_collected": 0,
+        "steps_taken": 0,
+    }
+
+    def __init__(self, capacity: int = 1):
+        self.size = 0
+        self.capacity = max(capacity, 1)
+        for name, (typecode, _) in self.COLUMNS.items():
+            setattr(self, "_" + name, array(typecode, bytes(self._bytes(typecode))))
+        self._exposed = False
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __getattr__(self, name: str):
+        # Only called for missing attributes: the NumPy views are made on first
+        # use after a change in size, so appending many rows stays cheap
+        if name not in self.COLUMNS:
+            raise AttributeError(name)
+        buffer = getattr(self, "_" + name)
+        view = np.frombuffer(buffer, dtype=self.COLUMNS[name][1])[: self.size]
+        setattr(self, name, view)
+        self._exposed = True
+        return view
+
+    def _bytes(self, typecode: str) -> int:
+        return array(typecode).itemsize * self.capacity
+
+    def _hide(self) -> None:
+        if self._exposed:
+            for name in self.COLUMNS:
+                self.__dict__.pop(name, None)
+            self._exposed = False
+
+    def _grow(self) -> None:
+        self.capacity *= 2
+        for name, (typecode, _) in self.COLUMNS.items():
+            old = getattr(self, "_" + name)
+            # A new buffer, since NumPy views keep the old one from resizing
+            grown = array(typecode, bytes(self._bytes(typecode)))
+            grown[: len(old)] = old
+            setattr(self, "_" + name, grown)
+
+    def append(self, x: int, y: int, direction, **values) -> int:
+        """Add a row for a new ant and return its index"""
+        row = self.size
+        if row == self.capacity:
+            self._grow()
+        if isinstance(direction, Direction):
+            direction = direction.value
+        self._x[row] = x
+        self._y[row] = y
+        self._direction[row] = direction
+        for name, value in (
+            {**self.DEFAULTS, **values} if values else self.DEFAULTS
+        ).items():
+            getattr(self, "_" + name)[row] = value
+        self.size += 1
+        self._hide()
+        return row
+
+    @classmethod
+    def gather(cls, ants: list) -> "AntPopulation":
+        """
+        New population holding copies of the rows of ants, in order, which
+        the ants view from now on. Rows are copied a source population at a
+        time, much faster than calling move_to for each ant.
+        """
+        population = cls(len(ants))
+        population.size = len(ants)
+        # Rows and new indices by source population
+        sources = {}
+        for index, ant in enumerate(ants):
+            source = sources.setdefault(id(ant._population), (ant._population, [], []))
+            source[1].append(ant._row)
+            source[2].append(index)
+        for source, rows, indices in sources.values():
+            for name in cls.COLUMNS:
+                getattr(population, name)[indices] = getattr(source, name)[rows]
+        for index, ant in enumerate(ants):
+            ant._population = population
+            ant._row = index
+        return population
+
+    def truncate(self, size: int) -> None:
+        """Drop the rows from size on, whose Ant objects must not be used again"""
+        self.size = min(size, self.size)
+        self._hide()
+
+    def get_row(self, row: int) -> dict:
+        """Get the values of one row by column name"""
+        return {name: getattr(self, "_" + name)[row] for name in self.COLUMNS}
+
+    def count_with_food(self) -> int:
+        """Number of ants carrying food"""
+        return int(np.count_nonzero(self.has_food))
+
 
 # Ant class with possible actions
 class Ant:
+    """
+    Ant whose state lives in one row of an AntPopulation.
+
+    An ant created without a population gets a population of its own, and
+    Environment.add_ant moves it into the environment's population. The
+    attributes read and write the row, so existing code can keep using
+    ant.x, ant.has_food and the other columns as before.
+    """
+
     def __init__(
         self,
         x: int,
@@ -23,21 +192,104 @@ class Ant:
         direction: Direction,
         strategy: AntStrategy,
         ant_id: int = None,
+        population: Optional[AntPopulation] = None,
     ):
-        self.x = x
-        self.y = y
-        self.direction = direction
+        self._population = AntPopulation() if population is None else population
+        self._row = self._population.append(x, y, direction)
         self.strategy = strategy
-        self.has_food = False
-        self.home_pheromone = 100.0
-        self.food_pheromone = 100.0
-        self.pheromone_decrease_rate = 0.995
         self.vision_range = 3  # How far the ant can see
         self.vision_angle = 120  # Field of view angle in degrees (total angle)
-        self.food_collected = 0
-        self.steps_taken = 0
         self.id = ant_id
 
+    # Columns of the population row, one property each for speed
+    @property
+    def x(self) -> int:
+        return self._population._x[self._row]
+
+    @x.setter
+    def x(self, value: int) -> None:
+        self._population._x[self._row] = value
+
+    @property
+    def y(self) -> int:
+        return self._population._y[self._row]
+
+    @y.setter
+    def y(self, value: int) -> None:
+        self._population._y[self._row] = value
+
+    @property
+    def has_food(self) -> bool:
+        return bool(self._population._has_food[self._row])
+
+    @has_food.setter
+    def has_food(self, value: bool) -> None:
+        self._population._has_food[self._row] = value
+
+    @property
+    def home_pheromone(self) -> float:
+        return self._population._home_pheromone[self._row]
+
+    @home_pheromone.setter
+    def home_pheromone(self, value: float) -> None:
+        self._population._home_pheromone[self._row] = value
+
+    @property
+    def food_pheromone(self) -> float:
+        return self._population._food_pheromone[self._row]
+
+    @food_pheromone.setter
+    def food_pheromone(self, value: float) -> None:
+        self._population._food_pheromone[self._row] = value
+
+    @property
+    def pheromone_decrease_rate(self) -> float:
+        return self._population._pheromone_decrease_rate[self._row]
+
+    @pheromone_decrease_rate.setter
+    def pheromone_decrease_rate(self, value: float) -> None:
+        self._population._pheromone_decrease_rate[self._row] = value
+
+    @property
+    def food_collected(self) -> int:
+        return self._population._food_collected[self._row]
+
+    @food_collected.setter
+    def food_collected(self, value: int) -> None:
+        self._population._food_collected[self._row] = value
+
+    @property
+    def steps_taken(self) -> int:
+        return self._population._steps_taken[self._row]
+
+    @steps_taken.setter
+    def steps_taken(self, value: int) -> None:
+        self._population._steps_taken[self._row] = value
+
+    @property
+    def direction(self) -> Direction:
+        return DIRECTIONS[self._population._direction[self._row]]
+
+    @direction.setter
+    def direction(self, direction) -> None:
+        if isinstance(direction, Direction):
+            direction = direction.value
+        self._population._direction[self._row] = direction
+
+    @property
+    def population(self) -> AntPopulation:
+        return self._population
+
+    @property
+    def row(self) -> int:
+        return self._row
+
+    def move_to(self, population: AntPopulation) -> None:
+        """Copy this ant's row to the end of population and view it from now on"""
+        values = self._population.get_row(self._row)
+        self._row = population.append(**values)
+        self._population = population
+
     def set_strategy(self, strategy: AntStrategy) -> None:
         self.strategy = strategy
 
@@ -4,6 +4,8 @@ import random
 import time
 
 class AntStrategy_concurrent(AntStrategy):
+    perception_fields = ("visible_cells",)  # Sólo se usa el terreno visible
+
     def __init__(self):
         self.position = (0, 0)  # Posición relativa actual (comienza en (0,0))
         self.ants_last_action = {}  # ant_id -> last_action
@@ -0,0 +1,614 @@
+# Command-line benchmarks for the ant colony simulation engine.
+
+import argparse
+import gc
+import glob
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from ant import AntPopulation, AntStrategy
+from common import PERCEPTION_SUMMARIES, AntAction, AntPerception, TerrainType
+from domains import PartitionedEnvironment
+from environment import Environment
+from perception import PERCEPTION_FIELDS, CompactAntPerception, StrategyBatch
+from pheromones import create_pheromone_map
+from random_strategy import RandomStrategy
+from utils import create_environment, add_ants, format_perception_usage
+
+
+def build_environment(
+    args, ant_count: int, env: str = None, strategy_file: str = None
+) -> Environment:
+    """Create a seeded environment with ant_count random ants, or ants of strategy_file"""
+    random.seed(args.seed)
+    environment = create_environment(
+        args.env if env is None else env,
+        args.width,
+        args.height,
+        verbose=False,
+        track_pheromone_changes=False,
+    )
+    add_ants(environment, "random", strategy_file, ant_count, verbose=False)
+    return environment
+
+
+def time_steps(environment: Environment, steps: int) -> float:
+    """Run steps updates and return the mean wall time per step in seconds"""
+    start_time = time.perf_counter()
+    for _ in range(steps):
+        environment.update()
+    return (time.perf_counter() - start_time) / steps
+
+
+def benchmark_occupancy(args) -> None:
+    """Step time with the linear nearby_ants scan and with the occupancy index"""
+    print(f"{'ants':>8} {'scan ms/step':>14} {'index ms/step':>14} {'speedup':>8}")
+    for ant_count in args.ants:
+        timings = {}
+        for use_index in (False, True):
+            # The linear scan is quadratic in the number of ants
+            if not use_index and ant_count > args.baseline_max_ants:
+                continue
+            environment = build_environment(args, ant_count)
+            environment.use_occupancy_index = use_index
+            timings[use_index] = time_steps(environment, args.steps)
+
+        scan = f"{timings[False] * 1000:.1f}" if False in timings else "skipped"
+        speedup = f"{timings[False] / timings[True]:.1f}x" if False in timings else "-"
+        print(f"{ant_count:>8} {scan:>14} {timings[True] * 1000:>14.1f} {speedup:>8}")
+
+
+def benchmark_perception(args) -> None:
+    """Perception time per step, one ant at a time and as one batch"""
+    print(
+        f"{'ants':>8} {'per-ant ms':>11} {'batch ms':>9} {'adapter ms':>11} {'speedup':>8}"
+    )
+    for ant_count in args.ants:
+        environment = build_environment(args, ant_count)
+        time_steps(environment, args.steps)
+
+        start_time = time.perf_counter()
+        for ant in environment.ants:
+            environment.get_perception_for_ant(ant)
+        per_ant = time.perf_counter() - start_time
+
+        start_time = time.perf_counter()
+        batch = environment.perceive_all()
+        batched = time.perf_counter() - start_time
+
+        # Building AntPerception objects for strategies that need them
+        start_time = time.perf_counter()
+        for index in range(ant_count):
+            batch.get_perception(index)
+        adapter = time.perf_counter() - start_time
+
+        print(
+            f"{ant_count:>8} {per_ant * 1000:>11.1f} {batched * 1000:>9.1f}"
+            f" {adapter * 1000:>11.1f} {per_ant / batched:>7.1f}x"
+        )
+
+
+def benchmark_lazy(args) -> None:
+    """Step time with eagerly and lazily built perception fields"""
+    print(f"{'ants':>8} {'eager ms/step':>14} {'lazy ms/step':>13} {'speedup':>8}")
+    for ant_count in args.ants:
+        timings = {}
+        for lazy in (False, True):
+            environment = build_environment(args, ant_count)
+            environment.lazy_perception = lazy
+            timings[lazy] = time_steps(environment, args.steps)
+        print(
+            f"{ant_count:>8} {timings[False] * 1000:>14.1f}"
+            f" {timings[True] * 1000:>13.1f} {timings[False] / timings[True]:>7.1f}x"
+        )
+        print(f"         {format_perception_usage(environment)}")
+
+
+def measure_perception_pass(environment: Environment, perceive) -> dict:
+    """Memory, allocations and time of perceiving once for every ant"""
+    ants = environment.ants
+    gc.collect()
+    collections = gc.get_stats()[0]["collections"]
+    tracemalloc.start()
+    start_memory = tracemalloc.get_traced_memory()[0]
+    start_time = time.perf_counter()
+    perceptions = [perceive(index, ant) for index, ant in enumerate(ants)]
+    elapsed = time.perf_counter() - start_time
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del perceptions
+    return {
+        "retained": (current - start_memory) / len(ants),
+        "allocated": (peak - start_memory) / len(ants),
+        "collections": gc.get_stats()[0]["collections"] - collections,
+        "time": elapsed,
+    }
+
+
+def benchmark_memory(args) -> None:
+    """Memory and allocations of fresh dict perceptions and pooled compact ones"""
+    print(
+        f"{'ants':>8} {'layout':>8} {'retained B/ant':>15} {'allocated B/ant':>16}"
+        f" {'gc runs':>8} {'ms/pass':>8}"
+    )
+    for ant_count in args.ants:
+        environment = build_environment(args, ant_count)
+        time_steps(environment, args.steps)
+        pool = [CompactAntPerception() for _ in environment.ants]
+
+        def fresh(index, ant):
+            return environment.get_perception_for_ant(ant)
+
+        def pooled(index, ant):
+            perception = pool[index]
+            current_terrain = environment.get_terrain(int(ant.x), int(ant.y))
+            cells = environment.get_visible_cells(ant)
+            perception.load_cells(environment, ant, current_terrain, cells)
+            return perception
+
+        # The pool is filled once before measuring, as after the first step
+        measure_perception_pass(environment, pooled)
+        for layout, perceive in (("dict", fresh), ("pooled", pooled)):
+            # Memory tracing slows the pass down, so time it separately
+            result = measure_perception_pass(environment, perceive)
+            start_time = time.perf_counter()
+            for index, ant in enumerate(environment.ants):
+                perceive(index, ant)
+            elapsed = time.perf_counter() - start_time
+            print(
+                f"{ant_count:>8} {layout:>8} {result['retained']:>15.0f}"
+                f" {result['allocated']:>16.0f} {result['collections']:>8}"
+                f" {elapsed * 1000:>8.1f}"
+            )
+
+
+def benchmark_incremental(args) -> None:
+    """Step time with perceptions rebuilt every step and reused when unchanged"""
+    print(
+        f"{'ants':>8} {'full ms/step':>13} {'incremental ms/step':>20} {'speedup':>8}"
+    )
+    for ant_count in args.ants:
+        timings = {}
+        for incremental in (False, True):
+            environment = build_environment(args, ant_count)
+            environment.incremental_perception = incremental
+            timings[incremental] = time_steps(environment, args.steps)
+        print(
+            f"{ant_count:>8} {timings[False] * 1000:>13.1f}"
+            f" {timings[True] * 1000:>20.1f} {timings[False] / timings[True]:>7.1f}x"
+        )
+        counts = environment.perception_cache.counts
+        total = sum(counts.values()) or 1
+        shares = ", ".join(
+            f"{kind} {count / total:.1%}" for kind, count in counts.items()
+        )
+        print(f"         Perceptions: {shares}")
+
+
+def benchmark_quantized(args) -> None:
+    """
+    Step the dense and quantized pheromone backends side by side with the
+    same random deposits, checking after every evaporation that both hold
+    pheromone on the same cells and that the quantized values stay within
+    max_relative_error of the dense ones. Without exact_lifetimes, quantized
+    cells may outlast dense ones, but not the other way around.
+    """
+    print(
+        f"{'deposits':>9} {'rate':>8} {'live cells':>11} {'worst error':>12}"
+        f" {'bound':>10} {'result':>7}"
+    )
+    failed = False
+    for ant_count in args.ants:
+        for rate in (0.999, 0.95, 0.99995, 1.0):
+            rng = np.random.default_rng(args.seed)
+            dense, quantized = (
+                create_pheromone_map(
+                    args.width, args.height, backend, rate, track_changes=False
+                )
+                for backend in ("dense", "quantized")
+            )
+            worst, same_cells = 0.0, True
+            for _ in range(args.steps):
+                xs = rng.integers(0, args.width, ant_count)
+                ys = rng.integers(0, args.height, ant_count)
+                amounts = rng.uniform(0.01, 100.0, ant_count)
+                for pheromones in (dense, quantized):
+                    pheromones.add_pheromones(xs, ys, amounts)
+                    pheromones.evaporate()
+                expected, values = dense.to_array(), quantized.to_array()
+                live = expected > 0.0
+                if quantized.exact_lifetimes:
+                    same_cells &= bool(np.array_equal(live, values > 0.0))
+                else:
+                    same_cells &= bool((values[live] > 0.0).all())
+                if live.any():
+                    errors = np.abs(values[live] - expected[live]) / expected[live]
+                    worst = max(worst, float(errors.max()))
+            passed = same_cells and worst <= quantized.max_relative_error
+            failed |= not passed
+            print(
+                f"{ant_count:>9} {rate:>8} {int(np.count_nonzero(live)):>11}"
+                f" {worst:>12.2e} {quantized.max_relative_error:>10.2e}"
+                f" {'ok' if passed else 'FAILED':>7}"
+            )
+    if failed:
+        raise SystemExit("Quantized pheromones drifted from the dense backend")
+
+
+def benchmark_population(args) -> None:
+    """Step time updating ants one at a time and as whole population arrays"""
+    print(f"{'ants':>8} {'per-ant ms/step':>16} {'arrays ms/step':>15} {'speedup':>8}")
+    for ant_count in args.ants:
+        timings = {}
+        for arrays in (False, True):
+            if not arrays and ant_count > args.baseline_max_ants:
+                continue
+            environment = build_environment(args, ant_count)
+            # Batch perception switches update() to applying actions on arrays
+            environment.batch_perception = arrays
+            timings[arrays] = time_steps(environment, args.steps)
+
+        per_ant = f"{timings[False] * 1000:.1f}" if False in timings else "skipped"
+        speedup = f"{timings[False] / timings[True]:.1f}x" if False in timings else "-"
+        print(
+            f"{ant_count:>8} {per_ant:>16} {timings[True] * 1000:>15.1f} {speedup:>8}"
+        )
+
+
+def benchmark_decisions(args) -> None:
+    """
+    Decision time per step, building a perception and calling decide_action
+    for each ant, and with one decide_actions call over the batch
+    """
+    print(f"{'ants':>8} {'per-ant ms':>11} {'batched ms':>11} {'speedup':>8}")
+    for ant_count in args.ants:
+        environment = build_environment(args, ant_count)
+        environment.batch_perception = True
+        time_steps(environment, args.steps)
+        batch = environment.perceive_all()
+        strategy = environment.ants[0].strategy
+        indices = np.arange(ant_count)
+
+        # Both start from the same strategy state and random numbers
+        last_actions = dict(strategy.ants_last_action)
+        random_state = random.getstate()
+        start_time = time.perf_counter()
+        for index in range(ant_count):
+            strategy.decide_action(batch.get_perception(index))
+        per_ant = time.perf_counter() - start_time
+
+        strategy.ants_last_action = last_actions
+        random.setstate(random_state)
+        start_time = time.perf_counter()
+        strategy.decide_actions(StrategyBatch(batch, indices, batch.get_perception))
+        batched = time.perf_counter() - start_time
+
+        print(
+            f"{ant_count:>8} {per_ant * 1000:>11.1f} {batched * 1000:>11.1f}"
+            f" {per_ant / batched:>7.1f}x"
+        )
+
+
+def benchmark_workers(args) -> None:
+    """Step time deciding serially and in worker processes, on the bundled maps"""
+    maps = sorted(glob.glob(os.path.join(os.path.dirname(__file__), "envs", "*.txt")))
+    print(
+        f"{'map':<32} {'ants':>6} {'serial ms/step':>15}"
+        f" {f'{args.workers} workers ms/step':>20} {'speedup':>8}"
+    )
+    for path in maps:
+        for ant_count in args.ants:
+            timings = {}
+            for workers in (1, args.workers):
+                environment = build_environment(
+                    args, ant_count, path, args.strategy_file
+                )
+                environment.decision_workers = workers
+                # The first step starts the pool and fills the strategy state
+                environment.update()
+                try:
+                    timings[workers] = time_steps(environment, args.steps)
+                finally:
+                    environment.stop_workers()
+            print(
+                f"{os.path.basename(path):<32} {ant_count:>6}"
+                f" {timings[1] * 1000:>15.1f} {timings[args.workers] * 1000:>20.1f}"
+                f" {timings[1] / timings[args.workers]:>7.1f}x"
+            )
+
+
+class FullPerceptionStrategy(RandomStrategy):
+    """Random ants perceiving every field, to compare whole perceptions"""
+
+    perception_fields = None
+
+
+def perception_state(perception) -> tuple:
+    """Everything a perception holds, for comparing two of them"""
+    fields = tuple(getattr(perception, name) for name in PERCEPTION_FIELDS)
+    summaries = tuple(getattr(perception, name) for name in PERCEPTION_SUMMARIES)
+    return (
+        fields
+        + summaries
+        + (
+            perception.has_food,
+            perception.direction,
+            perception.home_pheromone_level,
+            perception.food_pheromone_level,
+            perception.food_collected,
+            perception.steps_taken,
+            perception.ant_id,
+        )
+    )
+
+
+def benchmark_threads(args) -> None:
+    """
+    Perception time per step built serially and by --threads threads, one
+    ant at a time and from a batch, checking that both give the same result.
+    The ants move randomly but perceive every field.
+    """
+    gil = getattr(sys, "_is_gil_enabled", lambda: True)()
+    print(f"GIL {'enabled' if gil else 'disabled'}, {args.threads} threads")
+    print(
+        f"{'ants':>8} {'source':>7} {'serial ms':>10} {'threaded ms':>12}"
+        f" {'speedup':>8} {'rounds':>7} {'result':>8}"
+    )
+    for ant_count in args.ants:
+        environment = build_environment(args, ant_count)
+        strategy = FullPerceptionStrategy()
+        for ant in environment.ants:
+            ant.set_strategy(strategy)
+        environment.perception_threads = args.threads
+        indices = list(range(ant_count))
+        timings = {"ant": [0.0, 0.0], "batch": [0.0, 0.0]}
+        mismatches = {"ant": 0, "batch": 0}
+        try:
+            # Every round perceives a different world
+            for _ in range(args.steps):
+                environment.update()
+                batch = environment.perceive_all()
+                for source, build in (
+                    (
+                        "ant",
+                        lambda index: environment.get_perception_for_ant(
+                            environment.ants[index], lazy=False, incremental=False
+                        ),
+                    ),
+                    ("batch", batch.get_perception),
+                ):
+                    start_time = time.perf_counter()
+                    serial = [build(index) for index in indices]
+                    timings[source][0] += time.perf_counter() - start_time
+
+                    start_time = time.perf_counter()
+                    threaded = environment.perceive_in_threads(
+                        indices, batch if source == "batch" else None
+                    )
+                    timings[source][1] += time.perf_counter() - start_time
+
+                    mismatches[source] += abs(len(threaded) - len(serial))
+                    mismatches[source] += sum(
+                        perception_state(a) != perception_state(b)
+                        for a, b in zip(serial, threaded)
+                    )
+        finally:
+            environment.stop_threads()
+
+        for source, (serial, threaded) in timings.items():
+            result = "MISMATCH" if mismatches[source] else "match"
+            print(
+                f"{ant_count:>8} {source:>7} {serial / args.steps * 1000:>10.1f}"
+                f" {threaded / args.steps * 1000:>12.1f} {serial / threaded:>7.1f}x"
+                f" {args.steps:>7} {result:>8}"
+            )
+        if any(mismatches.values()):
+            raise SystemExit("Threaded perceptions differ from serial ones")
+
+
+class NeighbourStrategy(AntStrategy):
+    """
+    Ants steered only by what they perceive, other ants and trails included,
+    and without random numbers, so two runs of the same world can be compared
+    """
+
+    perception_fields = ("visible_cells", "food_pheromone", "nearby_ants")
+
+    def decide_action(self, perception: AntPerception) -> AntAction:
+        terrain = perception.visible_cells.get((0, 0))
+        if not perception.has_food and terrain == TerrainType.FOOD:
+            return AntAction.PICK_UP_FOOD
+        if perception.has_food and terrain == TerrainType.COLONY:
+            return AntAction.DROP_FOOD
+        # Ants take turns, so some move while the others look
+        if (perception.ant_id + perception.steps_taken) % 2 == 0:
+            if perception.has_food:
+                return AntAction.DEPOSIT_FOOD_PHEROMONE
+            return AntAction.DEPOSIT_HOME_PHEROMONE
+        crowd = sum(1 + has_food for _, has_food in perception.nearby_ants)
+        trail = int(sum(perception.food_pheromone.values()))
+        moves = (
+            AntAction.MOVE_FORWARD,
+            AntAction.MOVE_FORWARD,
+            AntAction.TURN_LEFT,
+            AntAction.MOVE_FORWARD,
+            AntAction.TURN_RIGHT,
+        )
+        return moves[(perception.ant_id + perception.steps_taken + crowd + trail) % 5]
+
+
+def ant_rows(records) -> list:
+    """The id and AntPopulation columns of every ant, sorted by id"""
+    names = ("id", *AntPopulation.COLUMNS)
+    rows = [tuple(record[name] for name in names) for record in records]
+    return sorted(rows)
+
+
+def benchmark_domains(args) -> None:
+    """
+    Step time of one environment with batch perception and of the same world
+    split into --domains bands of rows, with ants of NeighbourStrategy.
+    Checks that the split world ends with the same ants as the whole one, and
+    that two split runs of random ants from the same seed end alike.
+    """
+    print(
+        f"{'ants':>8} {'single ms/step':>15}"
+        f" {f'{args.domains} domains ms/step':>20} {'speedup':>8}"
+        f" {'matches':>8} {'repeatable':>11}"
+    )
+    failed = False
+    for ant_count in args.ants:
+        environment = build_environment(args, ant_count)
+        strategy = NeighbourStrategy()
+        for ant in environment.ants:
+            ant.set_strategy(strategy)
+        environment.batch_perception = True
+        single = time_steps(environment, args.steps)
+        expected = (
+            environment.food_collected,
+            ant_rows(
+                {**environment.population.get_row(ant.row), "id": ant.id}
+                for ant in environment.ants
+            ),
+        )
+        del environment
+        gc.collect()
+
+        # The same world split, then twice with random ants
+        runs = []
+        for neighbours in (True, False, False):
+            environment = build_environment(args, ant_count)
+            if neighbours:
+                strategy = NeighbourStrategy()
+                for ant in environment.ants:
+                    ant.set_strategy(strategy)
+            partitioned = PartitionedEnvironment(
+                environment, args.domains, seed=args.seed
+            )
+            del environment
+            gc.collect()
+            try:
+                timing = time_steps(partitioned, args.steps)
+                runs.append(
+                    (
+                        timing,
+                        partitioned.food_collected,
+                        ant_rows(partitioned.get_ant_records()),
+                    )
+                )
+            finally:
+                partitioned.close()
+        matches = runs[0][1:] == expected
+        repeatable = runs[1][1:] == runs[2][1:]
+        failed |= not (matches and repeatable)
+        print(
+            f"{ant_count:>8} {single * 1000:>15.1f} {runs[0][0] * 1000:>20.1f}"
+            f" {single / runs[0][0]:>7.1f}x {'yes' if matches else 'NO':>8}"
+            f" {'yes' if repeatable else 'NO':>11}"
+        )
+    if failed:
+        raise SystemExit("Partitioned runs differ from the undivided or repeated run")
+
+
+# Available benchmark scenarios, selectable by name
+SCENARIOS = {
+    "occupancy": benchmark_occupancy,
+    "perception": benchmark_perception,
+    "lazy": benchmark_lazy,
+    "memory": benchmark_memory,
+    "incremental": benchmark_incremental,
+    "quantized": benchmark_quantized,
+    "population": benchmark_population,
+    "decisions": benchmark_decisions,
+    "workers": benchmark_workers,
+    "threads": benchmark_threads,
+    "domains": benchmark_domains,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the ant colony simulation")
+    parser.add_argument(
+        "scenario",
+        choices=list(SCENARIOS),
+        help="Benchmark scenario to run",
+    )
+    parser.add_argument(
+        "--env",
+        type=str,
+        default="simple",
+        help="Environment type (simple, obstacle, maze) or path to environment file (default: simple)",
+    )
+    parser.add_argument(
+        "--width",
+        type=int,
+        default=200,
+        help="Environment width (default: 200) - ignored when loading from file",
+    )
+    parser.add_argument(
+        "--height",
+        type=int,
+        default=200,
+        help="Environment height (default: 200) - ignored when loading from file",
+    )
+    parser.add_argument(
+        "--ants",
+        type=int,
+        nargs="+",
+        default=[100, 1000, 10000],
+        help="Ant counts to benchmark (default: 100 1000 10000)",
+    )
+    parser.add_argument(
+        "--steps",
+        type=int,
+        default=10,
+        help="Simulation steps timed per run (default: 10)",
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=42,
+        help="Random seed, so every run sees the same ants (default: 42)",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="Worker processes for the workers scenario (default: number of CPUs)",
+    )
+    parser.add_argument(
+        "--threads",
+        type=int,
+        default=4,
+        help="Threads for the threads scenario (default: 4)",
+    )
+    parser.add_argument(
+        "--domains",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="Bands of rows for the domains scenario (default: number of CPUs)",
+    )
+    parser.add_argument(
+        "--strategy-file",
+        type=str,
+        default=os.path.join(os.path.dirname(__file__), "antStrategy_concurrent.py"),
+        help="Strategy of the ants in the workers scenario (default: antStrategy_concurrent.py)",
+    )
+    parser.add_argument(
+        "--baseline-max-ants",
+        type=int,
+        default=1000,
+        help="Skip slow reference runs above this many ants (default: 1000)",
+    )
+
+    args = parser.parse_args()
+    SCENARIOS[args.scenario](args)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,5 @@
 from enum import Enum
+from operator import itemgetter
 from typing import Optional
 import math
 
@@ -63,9 +64,36 @@ class AntAction(Enum):
 
 
 # Class for perception information
+# Facts derived from the perceived fields, computed once per perception and
+# then read as attributes, see AntPerception.summarize()
+PERCEPTION_SUMMARIES = (
+    "food_direction",
+    "colony_direction",
+    "strongest_food_pheromone",
+    "strongest_home_pheromone",
+)
+
+
 class AntPerception:
     """Class representing what an ant can perceive from its environment"""
 
+    # Fixed attribute set, so perceptions carry no per-instance __dict__
+    __slots__ = (
+        "visible_cells",
+        "food_pheromone",
+        "home_pheromone",
+        "nearby_ants",
+        "has_food",
+        "direction",
+        "home_pheromone_level",
+        "food_pheromone_level",
+        "pheromone_decrease_rate",
+        "food_collected",
+        "steps_taken",
+        "ant_id",
+        *PERCEPTION_SUMMARIES,
+    )
+
     def __init__(self):
         self.visible_cells = {}
         self.food_pheromone = {}
@@ -82,39 +110,78 @@ class AntPerception:
         self.steps_taken = 0
         self.ant_id = None
 
+    def __getattr__(self, name: str):
+        # Only called for attributes that have not been set yet, so summaries
+        # the environment did not precompute are computed on first read
+        if name == "food_direction" or name == "colony_direction":
+            self._summarize_terrain()
+        elif name == "strongest_food_pheromone":
+            self.strongest_food_pheromone = self._strongest(self.food_pheromone)
+        elif name == "strongest_home_pheromone":
+            self.strongest_home_pheromone = self._strongest(self.home_pheromone)
+        else:
+            raise AttributeError(name)
+        return object.__getattribute__(self, name)
+
+    def summarize(self) -> None:
+        """Compute all PERCEPTION_SUMMARIES from the perceived fields"""
+        self._summarize_terrain()
+        self.strongest_food_pheromone = self._strongest(self.food_pheromone)
+        self.strongest_home_pheromone = self._strongest(self.home_pheromone)
+
+    def clear_summaries(self) -> None:
+        """Forget computed summaries, for perceptions whose fields are refilled"""
+        for name in PERCEPTION_SUMMARIES:
+            try:
+                delattr(self, name)
+            except AttributeError:
+                pass
+
+    def _summarize_terrain(self) -> None:
+        # Nearest food and colony cells in one pass, first one on ties
+        food_dist = colony_dist = float("inf")
+        food_dir = colony_dir = None
+        food, colony = TerrainType.FOOD, TerrainType.COLONY
+
+        for (dx, dy), cell_type in self.visible_cells.items():
+            if cell_type == food:
+                dist = math.sqrt(dx * dx + dy * dy)
+                if dist < food_dist:
+                    food_dist = dist
+                    food_dir = self._get_direction_from_delta(dx, dy)
+            elif cell_type == colony:
+                dist = math.sqrt(dx * dx + dy * dy)
+                if dist < colony_dist:
+                    colony_dist = dist
+                    colony_dir = self._get_direction_from_delta(dx, dy)
+
+        self.food_direction = food_dir
+        self.colony_direction = colony_dir
+
+    @staticmethod
+    def _strongest(values) -> Optional[tuple]:
+        # First of the strongest cells, as max() over the items picks it
+        if not values:
+            return None
+        return max(values.items(), key=itemgetter(1))
+
     def can_see_food(self) -> bool:
-        return TerrainType.FOOD in [cell for cell in self.visible_cells.values()]
+        return self.food_direction is not None
 
     def can_see_colony(self) -> bool:
-        return TerrainType.COLONY in [
-            cell for cell in self.visible_cells.values()
-        ]
+        return self.colony_direction is not None
 
     def get_food_direction(self) -> Optional[int]:
-        min_dist = float("inf")
-        best_dir = None
-
-        for (dx, dy), cell_type in self.visible_cells.items():
-            if cell_type == TerrainType.FOOD:
-                dist = math.sqrt(dx * dx + dy * dy)
-                if dist < min_dist:
-                    min_dist = dist
-                    best_dir = self._get_direction_from_delta(dx, dy)
-
-        return best_dir
+        return self.food_direction
 
     def get_colony_direction(self) -> Optional[int]:
-        min_dist = float("inf")
-        best_dir = None
-
-        for (dx, dy), cell_type in self.visible_cells.items():
-            if cell_type == TerrainType.COLONY:
-                dist = math.sqrt(dx * dx + dy * dy)
-                if dist < min_dist:
-                    min_dist = dist
-                    best_dir = self._get_direction_from_delta(dx, dy)
+        return self.colony_direction
 
-        return best_dir
+    def get_strongest_pheromone(self, home: bool) -> Optional[tuple]:
+        """Get ((dx, dy), value) of the strongest visible home or food pheromone"""
+        if home:
+            return self.strongest_home_pheromone
+        return self.strongest_food_pheromone
 
     def _get_direction_from_delta(self, dx: int, dy: int) -> int:
         if dx == 0 and dy < 0:
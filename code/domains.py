@@ -0,0 +1,451 @@
+import multiprocessing
+import random
+from typing import List, Optional
+
+import numpy as np
+
+from ant import Ant, AntPopulation
+from common import Direction
+from environment import Environment, EnvironmentBuilder
+from pheromones import create_pheromone_map
+
+
+def _ant_record(ant: Ant, offset: int, strategy: int, state=None) -> dict:
+    """An ant's row and settings, with y in world coordinates"""
+    record = ant.population.get_row(ant.row)
+    record["y"] += offset
+    record.update(
+        id=ant.id,
+        strategy=strategy,
+        vision_range=ant.vision_range,
+        vision_angle=ant.vision_angle,
+        state=state,
+    )
+    return record
+
+
+def _add_ghosts(edge: tuple, records: List[dict], first: int) -> tuple:
+    """
+    edge, whose rows start at world row first, with the ants of records
+    standing in those rows added to its ghosts
+    """
+    last = first + len(edge[2])
+    arrivals = [record for record in records if first <= record["y"] < last]
+    if not arrivals:
+        return edge
+    ids, xs, ys, has_food = edge[3]
+    ghosts = (
+        ids + [record["id"] for record in arrivals],
+        np.append(xs, [record["x"] for record in arrivals]),
+        np.append(ys, [record["y"] for record in arrivals]),
+        np.append(has_food, [record["has_food"] for record in arrivals]),
+    )
+    return edge[:3] + (ghosts,)
+
+
+def _serve_domain(connection, spec: dict, strategies: list, seed: int) -> None:
+    """
+    Worker loop: build the Domain of spec and send its edges, then answer
+    ("step", above, below, migrants) with the result of Domain.step and
+    ("ants",) with Domain.records, until None arrives.
+    """
+    random.seed(seed)
+    try:
+        domain = Domain(spec, strategies)
+        connection.send(domain.edges())
+    except Exception as error:
+        connection.send(error)
+        connection.close()
+        return
+    while True:
+        message = connection.recv()
+        if message is None:
+            break
+        try:
+            if message[0] == "step":
+                result = domain.step(*message[1:])
+            else:
+                result = domain.records()
+        except Exception as error:
+            connection.send(error)
+        else:
+            connection.send(result)
+    connection.close()
+
+
+class Domain:
+    """
+    One band of rows of a partitioned world, as simulated by a worker.
+
+    The band is an Environment of its own holding the owned rows top ..
+    bottom - 1 plus up to halo rows of each neighbouring band, with local
+    row y being world row y + offset. Halo rows are overwritten with the
+    neighbour's copy before every step: pheromones, food, and its ants as
+    ghosts without a strategy, which are seen but do not act. Owned ants
+    come first in environment.ants, by id like in the undivided world, so
+    food goes to the same ants and nearby_ants sees the same neighbours.
+    """
+
+    def __init__(self, spec: dict, strategies: list):
+        self.top, self.bottom = spec["top"], spec["bottom"]
+        self.offset = spec["offset"]
+        self.strategies = strategies
+        environment = EnvironmentBuilder.create_from_arrays(
+            spec["grid"],
+            spec["food"],
+            spec["colony_mask"],
+            pheromone_backend=spec["pheromone_backend"],
+            track_pheromone_changes=False,
+        )
+        for name, value in spec["settings"].items():
+            setattr(environment, name, value)
+        maps = []
+        for values in (spec["home_pheromones"], spec["food_pheromones"]):
+            pheromones = create_pheromone_map(
+                environment.width,
+                environment.height,
+                environment.pheromone_backend,
+                spec["evaporation_rate"],
+                track_changes=False,
+                pyramid=environment.pheromone_pyramids,
+            )
+            pheromones.set_rows(0, values)
+            maps.append(pheromones)
+        environment.home_pheromones, environment.food_pheromones = maps
+        environment.batch_perception = True
+        self.environment = environment
+        incoming = AntPopulation(len(spec["ants"]))
+        self.ants = [self._make_ant(record, incoming) for record in spec["ants"]]
+        self.ants.sort(key=lambda ant: ant.id)
+        environment.ants = list(self.ants)
+        environment.rebuild_occupancy()
+
+    def _make_ant(self, record: dict, population: AntPopulation) -> Ant:
+        """Recreate an ant from its _ant_record, in local coordinates"""
+        values = dict(record)
+        ant_id, strategy = values.pop("id"), self.strategies[values.pop("strategy")]
+        ant = Ant(
+            values.pop("x"),
+            values.pop("y") - self.offset,
+            values.pop("direction"),
+            strategy,
+            ant_id,
+            population,
+        )
+        ant.vision_range = values.pop("vision_range")
+        ant.vision_angle = values.pop("vision_angle")
+        state = values.pop("state")
+        if state is not None:
+            strategy.push_ant_state(ant_id, state)
+        for name, value in values.items():
+            setattr(ant, name, value)
+        return ant
+
+    def _edge(self, first: int, rows: int) -> tuple:
+        """Local rows first .. first + rows - 1 as a neighbour's halo"""
+        environment = self.environment
+        width = environment.width
+        # Owned ants are the first rows of the population
+        population = environment.population
+        ys = population.y[: len(self.ants)]
+        inside = np.flatnonzero((ys >= first) & (ys < first + rows))
+        ghosts = (
+            [self.ants[index].id for index in inside.tolist()],
+            population.x[inside],
+            ys[inside] + self.offset,
+            population.has_food[inside],
+        )
+        return (
+            environment.home_pheromones.get_region(0, first, width, rows),
+            environment.food_pheromones.get_region(0, first, width, rows),
+            environment.food_array[first : first + rows].copy(),
+            ghosts,
+        )
+
+    def edges(self) -> tuple:
+        """The halos of the bands above and below, None at the world's edges"""
+        top, bottom = self.top - self.offset, self.bottom - self.offset
+        above = top if top else None
+        below = self.environment.height - bottom or None
+        return (
+            None if above is None else self._edge(top, above),
+            None if below is None else self._edge(bottom - below, below),
+        )
+
+    def _receive(self, first: int, halo: tuple, population: AntPopulation) -> list:
+        """Overwrite local rows from first with a neighbour's edge"""
+        environment = self.environment
+        home, food, food_amounts, ghosts = halo
+        environment.home_pheromones.set_rows(first, home)
+        environment.food_pheromones.set_rows(first, food)
+        # Food only ever gets picked up while the simulation runs
+        current = environment.food_array[first : first + len(food_amounts)]
+        for y, x in np.argwhere(current > food_amounts).tolist():
+            for _ in range(int(current[y, x] - food_amounts[y, x])):
+                environment.remove_food(x, first + y)
+        arrivals = []
+        ids, xs, ys, has_food = ghosts
+        for ant_id, x, y, carrying in zip(
+            ids, xs.tolist(), (ys - self.offset).tolist(), has_food.tolist()
+        ):
+            ghost = Ant(x, y, Direction.NORTH, None, ant_id, population)
+            ghost.has_food = carrying
+            # Only seen by the others, so nothing to perceive
+            ghost.vision_range = 0
+            arrivals.append(ghost)
+        return arrivals
+
+    def step(
+        self, above: Optional[tuple], below: Optional[tuple], migrants: List[dict]
+    ) -> tuple:
+        """
+        Take the neighbours' edges and the ants moving in, and run one update.
+        Returns the new edges, the records of the ants that left through the
+        top and the bottom, and (food collected, ants, ants carrying food).
+        """
+        environment = self.environment
+        # New ants go after the owned ones, which keep their rows unless
+        # migrants have lower ids
+        population = environment.population
+        population.truncate(len(self.ants))
+        if migrants:
+            self.ants += [self._make_ant(record, population) for record in migrants]
+            self.ants.sort(key=lambda ant: ant.id)
+        ghosts = []
+        for first, halo in ((0, above), (self.bottom - self.offset, below)):
+            if halo is not None:
+                ghosts += self._receive(first, halo, population)
+        ghosts.sort(key=lambda ant: ant.id)
+        environment.ants = self.ants + ghosts
+        environment.rebuild_occupancy()
+        environment.update()
+
+        ys = environment.population.y[: len(self.ants)]
+        top, bottom = self.top - self.offset, self.bottom - self.offset
+        leaving = np.flatnonzero((ys < top) | (ys >= bottom)).tolist()
+        up, down = [], []
+        for index in leaving:
+            ant = self.ants[index]
+            strategy = self.strategies.index(ant.strategy)
+            state = ant.strategy.pop_ant_state(ant.id)
+            record = _ant_record(ant, self.offset, strategy, state)
+            (up if ant.y < top else down).append(record)
+        if leaving:
+            gone = set(leaving)
+            self.ants = [ant for i, ant in enumerate(self.ants) if i not in gone]
+            # Ghosts are replaced by the next step anyway
+            environment.ants = list(self.ants)
+            environment.rebuild_occupancy()
+        stats = (
+            environment.food_collected,
+            len(self.ants),
+            int(np.count_nonzero(environment.population.has_food[: len(self.ants)])),
+        )
+        return self.edges(), up, down, stats
+
+    def records(self) -> List[dict]:
+        """The _ant_record of every owned ant, without strategy state"""
+        return [
+            _ant_record(ant, self.offset, self.strategies.index(ant.strategy))
+            for ant in self.ants
+        ]
+
+
+class PartitionedEnvironment:
+    """
+    An environment split into bands of rows, each simulated by a worker
+    process, for worlds too big for one core.
+
+    Every band keeps a halo of the neighbouring rows, wide enough for the
+    ants to perceive across the border: by default the largest vision_range
+    plus one row, which also covers the one row diffusion reaches per step.
+    Strategies reading pheromones further away need a deeper halo. After
+    each step the workers send their edge rows to the neighbours through
+    this process, along with the ants that crossed a border.
+
+    Ants need distinct ids and a strategy, which they may share. Strategies
+    are copied into each worker, and per-ant state follows an ant across
+    borders through AntStrategy.pop_ant_state and push_ant_state. Workers seed random from
+    seed plus their index, so runs are reproducible for a given seed and
+    number of domains. With a strategy that does not draw random numbers,
+    the result is the same as environment.update() with batch_perception.
+
+    Walls, colonies and pheromone settings are copied when the workers
+    start; only food and pheromones change afterwards. environment itself
+    is left as it was and can be dropped to save memory.
+    """
+
+    def __init__(
+        self,
+        environment: Environment,
+        domains: int,
+        seed: int = 0,
+        halo: Optional[int] = None,
+    ):
+        ants = environment.ants
+        ids = [ant.id for ant in ants]
+        if None in ids or len(set(ids)) != len(ids):
+            raise ValueError("Partitioned ants need distinct ids")
+        if any(not ant.strategy for ant in ants):
+            raise ValueError("Partitioned ants need a strategy")
+        if halo is None:
+            halo = max((ant.vision_range for ant in ants), default=3) + 1
+        height = environment.height
+        bounds = [height * index // domains for index in range(domains + 1)]
+        if domains < 1 or height // domains < halo:
+            raise ValueError(
+                f"Cannot split {height} rows into {domains} bands of at least "
+                f"{halo} rows (the halo)"
+            )
+        self.width, self.height = environment.width, height
+        self.bounds = bounds
+        self.domains = domains
+        self.halo = halo
+        self.initial_food_amount = environment.initial_food_amount
+        self.food_collected = self._collected_before = environment.food_collected
+        self.steps = environment.steps
+        self.ant_count = len(ants)
+        self.ants_with_food = environment.population.count_with_food()
+
+        # Distinct strategy instances, in order of first appearance
+        self.strategies = []
+        positions = {}
+        for ant in ants:
+            if id(ant.strategy) not in positions:
+                positions[id(ant.strategy)] = len(self.strategies)
+                self.strategies.append(ant.strategy)
+        owners = np.searchsorted(bounds, environment.population.y, side="right") - 1
+        members = [[] for _ in range(domains)]
+        for ant, owner in zip(ants, owners.tolist()):
+            members[owner].append(ant)
+
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context("fork" if "fork" in methods else None)
+        self.connections = []
+        self.processes = []
+        for index in range(domains):
+            top, bottom = bounds[index], bounds[index + 1]
+            first, last = max(top - halo, 0), min(bottom + halo, height)
+            spec = {
+                "top": top,
+                "bottom": bottom,
+                "offset": first,
+                "grid": environment.grid_array[first:last],
+                "food": environment.food_array[first:last],
+                "colony_mask": environment.colony_mask[first:last],
+                "home_pheromones": environment.home_pheromones.get_region(
+                    0, first, self.width, last - first
+                ),
+                "food_pheromones": environment.food_pheromones.get_region(
+                    0, first, self.width, last - first
+                ),
+                "pheromone_backend": environment.pheromone_backend,
+                "evaporation_rate": environment.home_pheromones.evaporation_rate,
+                "settings": {
+                    "pheromone_pyramids": environment.pheromone_pyramids,
+                    "pheromones_enabled": environment.pheromones_enabled,
+                    "diffusion_rate": environment.diffusion_rate,
+                    "batch_deposits": environment.batch_deposits,
+                },
+                "ants": [
+                    _ant_record(ant, 0, positions[id(ant.strategy)])
+                    for ant in members[index]
+                ],
+            }
+            connection, child_connection = context.Pipe()
+            process = context.Process(
+                target=_serve_domain,
+                args=(child_connection, spec, self.strategies, seed + index),
+                daemon=True,
+            )
+            process.start()
+            child_connection.close()
+            self.connections.append(connection)
+            self.processes.append(process)
+        self._edges = self._gather()
+        self._migrants = [[] for _ in range(domains)]
+
+    def _gather(self) -> list:
+        """Receive one result from every worker, raising the first error"""
+        results = [connection.recv() for connection in self.connections]
+        for result in results:
+            if isinstance(result, Exception):
+                self.close()
+                raise result
+        return results
+
+    def update(self) -> None:
+        """Run one step in every band and pass on edges and migrating ants"""
+        last = self.domains - 1
+        # Every worker gets its message before any result is awaited
+        for index, connection in enumerate(self.connections):
+            above = self._edges[index - 1][1] if index > 0 else None
+            below = self._edges[index + 1][0] if index < last else None
+            connection.send(("step", above, below, self._migrants[index]))
+        results = self._gather()
+        self._migrants = [[] for _ in range(self.domains)]
+        for index, (edges, up, down, _) in enumerate(results):
+            self._edges[index] = edges
+            if up:
+                self._migrants[index - 1] += up
+            if down:
+                self._migrants[index + 1] += down
+        # Edges are taken before ants move in, so the ants that just crossed
+        # into a band's edge rows are added as ghosts for its neighbours
+        for index, migrants in enumerate(self._migrants):
+            if not migrants:
+                continue
+            above, below = self._edges[index]
+            if above is not None:
+                above = _add_ghosts(above, migrants, self.bounds[index])
+            if below is not None:
+                first = self.bounds[index + 1] - len(below[2])
+                below = _add_ghosts(below, migrants, first)
+            self._edges[index] = (above, below)
+        stats = [result[3] for result in results]
+        moving = [record for migrants in self._migrants for record in migrants]
+        self.food_collected = self._collected_before + sum(stat[0] for stat in stats)
+        self.ant_count = sum(stat[1] for stat in stats) + len(moving)
+        self.ants_with_food = sum(stat[2] for stat in stats) + sum(
+            record["has_food"] for record in moving
+        )
+        self.steps += 1
+
+    def get_ant_records(self) -> List[dict]:
+        """
+        The state of every ant as a dict of the AntPopulation columns plus
+        id, strategy (an index into strategies), vision_range and
+        vision_angle, in world coordinates and sorted by id
+        """
+        for connection in self.connections:
+            connection.send(("ants",))
+        records = [record for result in self._gather() for record in result]
+        for migrants in self._migrants:
+            records += [{**record, "state": None} for record in migrants]
+        return sorted(records, key=lambda record: record["id"])
+
+    def is_complete(self) -> bool:
+        return (
+            self.food_collected >= self.initial_food_amount
+            and self.initial_food_amount > 0
+        )
+
+    def get_completion_percentage(self) -> float:
+        if self.initial_food_amount == 0:
+            return 0.0
+        return self.food_collected / self.initial_food_amount * 100.0
+
+    def close(self) -> None:
+        """Stop the worker processes"""
+        for connection in self.connections:
+            try:
+                connection.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+            connection.close()
+        for process in self.processes:
+            process.join(timeout=1)
+            if process.is_alive():
+                process.terminate()
+        self.connections = []
+        self.processes = []
@@ -1,98 +1,104 @@
 from typing import Optional
-from ant import Ant
+from ant import Ant, AntPopulation
 import random
+import bisect
 import math
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 from common import (
     TerrainType,
     Direction,
     AntPerception,
     AntAction,
 )
+from perception import (
+    PERCEPTION_FIELDS,
+    BatchPerception,
+    CompactAntPerception,
+    LazyAntPerception,
+    LineOfSightCache,
+    PerceptionCache,
+    StrategyBatch,
+    VisibleCellSource,
+    copy_ant_state,
+    get_strategy_needs,
+    get_vision_stencil,
+)
+from parallel import DecisionPool
+from pheromones import (
+    DIRECTION_DX,
+    DIRECTION_DY,
+    PheromoneMap,
+    VERSION_REGION_SIZE,
+    create_pheromone_map,
+    new_region_versions,
+    read_region,
+    region_stamp,
+    resolve_pheromone_backend,
+)
 
+# Terrain value reported by the bulk accessors for cells outside the map
+OUTSIDE_TERRAIN = -1
 
-# Class for pheromone handling
-class PheromoneMap:
-    def __init__(self, width: int, height: int, evaporation_rate: float = 0.999):
-        self.width = width
-        self.height = height
-        self.evaporation_rate = evaporation_rate
-        # Use a dictionary for sparse representation of pheromones
-        # Key is (x, y) tuple, value is pheromone strength
-        self.values = {}
-        self.modified_positions = set()
-
-    def add_pheromone(self, x: int, y: int, amount: float) -> None:
-        """Add pheromone at position (x, y)"""
-        if 0 <= x < self.width and 0 <= y < self.height:
-            pos = (x, y)
-            # Add maximum pheromone amount between current and new amount
-            self.values[pos] = max(self.values.get(pos, 0), amount)
-            self.modified_positions.add(pos)
-
-    def get_value(self, x: int, y: int) -> float:
-        """Get pheromone value at position (x, y)"""
-        if 0 <= x < self.width and 0 <= y < self.height:
-            return self.values.get((x, y), 0.0)
-        return 0.0
-
-    def evaporate(self) -> None:
-        """Evaporate pheromones"""
-        # Create a list of positions to potentially remove
-        positions_to_remove = []
-
-        # Update all pheromone values
-        for pos, value in self.values.items():
-            # Apply evaporation
-            new_value = value * self.evaporation_rate
-
-            # If value is very small, mark for removal
-            if new_value < 0.01:
-                positions_to_remove.append(pos)
-            else:
-                self.values[pos] = new_value
-                self.modified_positions.add(pos)
-
-        # Remove very small values
-        for pos in positions_to_remove:
-            del self.values[pos]
-
-    def get_strongest_direction(
-        self, x: int, y: int, vision_range: int = 3
-    ) -> Optional[Direction]:
-        """Get direction with highest pheromone concentration"""
-        max_value = 0.0
-        best_direction = None
-
-        for direction in Direction:
-            dx, dy = Direction.get_delta(direction)
-            value_sum = 0.0
-
-            for strength in range(1, vision_range + 1):
-                check_x, check_y = x + dx * strength, y + dy * strength
-                if 0 <= check_x < self.width and 0 <= check_y < self.height:
-                    value_sum += (
-                        self.get_value(int(check_x), int(check_y)) / strength
-                    )  # Closer is stronger
-
-            if value_sum > max_value:
-                max_value = value_sum
-                best_direction = direction
-
-        return best_direction
+# Action code update() records for ants without a strategy
+NO_DECISION = -1
 
 
 # Environment class to represent the world
 class Environment:
-    def __init__(self, width: int, height: int):
+    def __init__(
+        self,
+        width: int,
+        height: int,
+        pheromone_backend: str = "dict",
+        track_pheromone_changes: bool = True,
+    ):
         self.width = width
         self.height = height
+        self.pheromone_backend = resolve_pheromone_backend(
+            pheromone_backend, width, height
+        )
+        # Whether pheromone maps record changed cells for drain_dirty()
+        self.track_pheromone_changes = track_pheromone_changes
+        # Whether pheromone maps keep a pyramid for long-range queries
+        self.pheromone_pyramids = False
         self.grid = [
             [TerrainType.EMPTY.value for _ in range(width)] for _ in range(height)
         ]
+        # NumPy mirror of grid for vectorized passes, kept in sync by _set_cell
+        self.grid_array = np.full(
+            (height, width), TerrainType.EMPTY.value, dtype=np.int8
+        )
+        self._open_cells = None
+        # Terrain as get_terrain reports it, with the colony footprints merged
+        # into the grid. Kept in sync by _set_cell and add_colony.
+        self.colony_mask = np.zeros((height, width), dtype=bool)
+        self.terrain = [
+            [TerrainType.EMPTY for _ in range(width)] for _ in range(height)
+        ]
+        self.terrain_array = np.full(
+            (height, width), TerrainType.EMPTY.value, dtype=np.int8
+        )
+        # Terrain changes per region, bumped by _update_terrain
+        self.terrain_versions = new_region_versions(width, height)
+        # Walls blocking each vision ray, built on demand and reset by add_wall
+        self._line_of_sight = LineOfSightCache(self._is_line_blocked)
         self.food_amounts = [[0 for _ in range(width)] for _ in range(height)]
-        self.home_pheromones = PheromoneMap(width, height)
-        self.food_pheromones = PheromoneMap(width, height)
+        # NumPy mirror of food_amounts, kept in sync by add_food and remove_food
+        self.food_array = np.zeros((height, width), dtype=np.int32)
+        self.home_pheromones = self._create_pheromone_map()
+        self.food_pheromones = self._create_pheromone_map()
         self.ants = []
+        # State of self.ants as parallel arrays, row i belonging to self.ants[i].
+        # Kept in order by add_ant and rebuild_occupancy.
+        self.population = AntPopulation()
+        # Indices into self.ants of the ants on each occupied (x, y) cell, in
+        # ascending order, for O(1) nearby_ants lookups. Kept up to date by
+        # add_ant and execute_action; call rebuild_occupancy() after moving
+        # ants or changing self.ants any other way.
+        self.use_occupancy_index = True
+        self._occupancy = {}
+        self._ant_index = {}
         self.colony_positions = []
         self.colony_radius = 2  # This creates a 5x5 area (radius 2 around center point)
         self.food_positions = set()
@@ -100,21 +106,109 @@ class Environment:
         self.food_collected = 0
         self.steps = 0
         self.pheromones_enabled = True
+        # Share of pheromone exchanged with each open neighbour per step, 0 disables
+        self.diffusion_rate = 0.0
+        # Collect deposits as (xs, ys, amounts) and apply them at the end of update()
+        self.batch_deposits = False
+        self._home_deposits = ([], [], [])
+        self._food_deposits = ([], [], [])
+        # Perceive for all ants at the start of update() in one batched pass
+        self.batch_perception = False
+        self._perception_batch = BatchPerception()
+        # Build perceived fields only when a strategy reads them, and count
+        # how many perceptions were made and how often each field was read
+        self.lazy_perception = False
+        self.perception_usage = dict.fromkeys(("perceptions", *PERCEPTION_FIELDS), 0)
+        # Reuse one CompactAntPerception per ant slot across steps in update()
+        self.pooled_perception = False
+        self._perception_pool = []
+        # Reuse the last perception of ants that kept their cell, refreshing
+        # only what changed since, in get_perception_for_ant
+        self.incremental_perception = False
+        self.perception_cache = PerceptionCache()
+        # Number of worker processes deciding actions in update(), 1 for none.
+        # The pool starts on first use, call stop_workers() when done.
+        self.decision_workers = 1
+        self._decision_pool = None
+        # Number of threads building perceptions in update(), 1 for none, see
+        # perceive_in_threads(). The pool is (threads, ThreadPoolExecutor).
+        self.perception_threads = 1
+        self._perception_executor = None
         self.next_ant_id = 1  # For tracking sequential ant IDs
 
+    def _create_pheromone_map(self) -> PheromoneMap:
+        return create_pheromone_map(
+            self.width,
+            self.height,
+            self.pheromone_backend,
+            track_changes=self.track_pheromone_changes,
+            pyramid=self.pheromone_pyramids,
+        )
+
+    def set_pheromone_backend(
+        self, backend: str, track_changes: Optional[bool] = None
+    ) -> None:
+        """Switch pheromone storage backend, discarding current pheromones"""
+        self.pheromone_backend = resolve_pheromone_backend(
+            backend, self.width, self.height
+        )
+        if track_changes is not None:
+            self.track_pheromone_changes = track_changes
+        self.home_pheromones = self._create_pheromone_map()
+        self.food_pheromones = self._create_pheromone_map()
+
+    def enable_pheromone_pyramids(self) -> None:
+        """Maintain pyramids for get_strongest_direction_within() on both maps"""
+        self.pheromone_pyramids = True
+        self.home_pheromones.enable_pyramid()
+        self.food_pheromones.enable_pyramid()
+
     def disable_pheromones(self) -> None:
         self.pheromones_enabled = False
-        self.home_pheromones = PheromoneMap(self.width, self.height)
-        self.food_pheromones = PheromoneMap(self.width, self.height)
+        self.home_pheromones = self._create_pheromone_map()
+        self.food_pheromones = self._create_pheromone_map()
+
+    def _set_cell(self, x: int, y: int, terrain: int) -> None:
+        self.grid[y][x] = terrain
+        self.grid_array[y, x] = terrain
+        self._update_terrain(x, y)
+
+    def _update_terrain(self, x: int, y: int) -> None:
+        terrain = self.grid[y][x]
+        # Empty cells and colony cells inside a colony radius read as colony
+        if self.colony_mask[y, x] and terrain in (
+            TerrainType.EMPTY.value,
+            TerrainType.COLONY.value,
+        ):
+            terrain = TerrainType.COLONY.value
+        self.terrain_array[y, x] = terrain
+        self.terrain[y][x] = TerrainType(terrain)
+        self.terrain_versions[y // VERSION_REGION_SIZE, x // VERSION_REGION_SIZE] += 1
+
+    def get_terrain_stamp(self, x: int, y: int, radius: int) -> int:
+        """
+        Get a stamp of the terrain within radius of (x, y), which changes
+        whenever a cell in the regions around that square changes
+        """
+        return region_stamp(self.terrain_versions, x, y, radius)
+
+    def get_open_cells(self) -> np.ndarray:
+        """Get a (height, width) boolean array of the cells that are not walls"""
+        if self._open_cells is None:
+            self._open_cells = self.grid_array != TerrainType.WALL.value
+        return self._open_cells
 
     def add_wall(self, x: int, y: int) -> None:
         if self.is_valid_position(x, y):
-            self.grid[y][x] = TerrainType.WALL.value
+            self._set_cell(x, y, TerrainType.WALL.value)
+            self._open_cells = None
+            self._line_of_sight.invalidate(x, y)
 
     def add_food(self, x: int, y: int, amount: int = 1) -> None:
         if self.is_valid_position(x, y) and self.grid[y][x] == TerrainType.EMPTY.value:
-            self.grid[y][x] = TerrainType.FOOD.value
+            self._set_cell(x, y, TerrainType.FOOD.value)
             self.food_amounts[y][x] += amount
+            self.food_array[y, x] += amount
             self.food_positions.add((x, y))
             self.initial_food_amount += amount
 
@@ -132,9 +226,10 @@ class Environment:
             and self.food_amounts[y][x] > 0
         ):
             self.food_amounts[y][x] -= 1
+            self.food_array[y, x] -= 1
 
             if self.food_amounts[y][x] == 0:
-                self.grid[y][x] = TerrainType.EMPTY.value
+                self._set_cell(x, y, TerrainType.EMPTY.value)
                 self.food_positions.discard((x, y))
 
             return True
@@ -143,12 +238,87 @@ class Environment:
 
     def add_colony(self, x: int, y: int) -> None:
         if self.is_valid_position(x, y) and self.grid[y][x] == TerrainType.EMPTY.value:
-            self.grid[y][x] = TerrainType.COLONY.value
+            self._set_cell(x, y, TerrainType.COLONY.value)
             self.colony_positions.append((x, y))
 
+            # Uses the colony_radius in effect when the colony is added
+            radius = self.colony_radius
+            for footprint_y in range(
+                max(y - radius, 0), min(y + radius + 1, self.height)
+            ):
+                for footprint_x in range(
+                    max(x - radius, 0), min(x + radius + 1, self.width)
+                ):
+                    self.colony_mask[footprint_y, footprint_x] = True
+                    self._update_terrain(footprint_x, footprint_y)
+
     def add_ant(self, ant) -> None:
+        if ant.population is not self.population:
+            ant.move_to(self.population)
+        elif ant.row != len(self.ants):
+            raise ValueError("Ant was created for another row of this population")
+        self._ant_index[ant] = len(self.ants)
+        self._occupancy.setdefault((int(ant.x), int(ant.y)), []).append(len(self.ants))
         self.ants.append(ant)
 
+    def rebuild_occupancy(self) -> None:
+        """Rebuild the occupancy index from the current ant positions"""
+        if any(ant.population is not self.population for ant in self.ants) or any(
+            ant.row != index for index, ant in enumerate(self.ants)
+        ):
+            # Ants were added, removed or reordered: copy them into new rows
+            self.population = AntPopulation.gather(self.ants)
+        else:
+            # Rows left over from ants removed at the end
+            self.population.truncate(len(self.ants))
+        self._ant_index = dict(zip(self.ants, range(len(self.ants))))
+        self._index_occupancy()
+
+    def _index_occupancy(self) -> None:
+        """Rebuild the occupancy index from the population arrays"""
+        xs, ys = self.population.x, self.population.y
+        # Sorted by cell, and by index within a cell since lexsort is stable
+        order = np.lexsort((xs, ys))
+        sorted_xs, sorted_ys = xs[order], ys[order]
+        new_cell = np.ones(len(order), dtype=bool)
+        new_cell[1:] = (sorted_xs[1:] != sorted_xs[:-1]) | (
+            sorted_ys[1:] != sorted_ys[:-1]
+        )
+        starts = np.flatnonzero(new_cell).tolist()
+        order = order.tolist()
+        self._occupancy = {
+            cell: order[start:end]
+            for cell, start, end in zip(
+                zip(sorted_xs[starts].tolist(), sorted_ys[starts].tolist()),
+                starts,
+                starts[1:] + [len(order)],
+            )
+        }
+
+    def _move_occupant(self, ant: Ant, old_cell: tuple, new_cell: tuple) -> None:
+        index = self._ant_index[ant]
+        occupants = self._occupancy[old_cell]
+        occupants.remove(index)
+        if not occupants:
+            del self._occupancy[old_cell]
+        bisect.insort(self._occupancy.setdefault(new_cell, []), index)
+
+    def get_ant_at(
+        self, x: int, y: int, exclude: Optional[Ant] = None
+    ) -> Optional[Ant]:
+        """Get the first ant in self.ants standing on (x, y), other than exclude"""
+        if self.use_occupancy_index:
+            for index in self._occupancy.get((x, y), ()):
+                other_ant = self.ants[index]
+                if other_ant != exclude:
+                    return other_ant
+            return None
+
+        for other_ant in self.ants:
+            if other_ant != exclude and int(other_ant.x) == x and int(other_ant.y) == y:
+                return other_ant
+        return None
+
     def is_valid_position(self, x: int, y: int) -> bool:
         return 0 <= x < self.width and 0 <= y < self.height
 
@@ -158,150 +328,398 @@ class Environment:
         )
 
     def get_terrain(self, x: int, y: int) -> Optional[TerrainType]:
-        if self.is_valid_position(x, y):
-            # Check if the position is within the colony radius
-            for colony_x, colony_y in self.colony_positions:
-                # Check if the position is within the colony radius
-                if (
-                    abs(x - colony_x) <= self.colony_radius
-                    and abs(y - colony_y) <= self.colony_radius
-                ):
-                    if self.grid[y][x] == TerrainType.FOOD.value:
-                        return TerrainType.FOOD
-                    elif self.grid[y][x] == TerrainType.WALL.value:
-                        return TerrainType.WALL
-                    return TerrainType.COLONY
-
-            # If not in colony radius, return the actual terrain
-            return TerrainType(self.grid[y][x])
+        if 0 <= x < self.width and 0 <= y < self.height:
+            return self.terrain[y][x]
         return None
 
-    def update(self) -> None:
-        if self.pheromones_enabled:
-            self.home_pheromones.evaporate()
-            self.food_pheromones.evaporate()
-        for ant in self.ants:
-            perception = self.get_perception_for_ant(ant)
-            action = ant.decide_action(perception)
-            self.execute_action(ant, action)
-
-        self.steps += 1
-
-    def get_perception_for_ant(self, ant: Ant) -> AntPerception:
-
-        perception = AntPerception()
-        perception.has_food = ant.has_food
-        perception.direction = ant.direction
-        perception.home_pheromone_level = ant.home_pheromone
-        perception.food_pheromone_level = ant.food_pheromone
-        perception.pheromone_decrease_rate = ant.pheromone_decrease_rate
-        perception.food_collected = ant.food_collected
-        perception.steps_taken = ant.steps_taken
-        perception.ant_id = ant.id
-
-        current_terrain = self.get_terrain(int(ant.x), int(ant.y))
-        if current_terrain is not None:
-            perception.visible_cells[(0, 0)] = current_terrain
-
-        for dx in range(-ant.vision_range, ant.vision_range + 1):
-            for dy in range(-ant.vision_range, ant.vision_range + 1):
-                if dx == 0 and dy == 0:
-                    continue
-
-                check_x = int(ant.x + dx)
-                check_y = int(ant.y + dy)
-
-                # Check if the point is within the ant's vision field based on distance and angle
-
-                # Calculate distance
-                distance = math.sqrt(dx * dx + dy * dy)
-
-                # If point is too far, it's not in vision field
-                if distance > ant.vision_range:
-                    continue
+    def get_terrain_values(self, xs, ys) -> np.ndarray:
+        """
+        Get the TerrainType values get_terrain would return at many positions.
 
-                # Get ant's direction vector
-                dir_dx, dir_dy = Direction.get_delta(ant.direction)
+        Positions outside the map read as OUTSIDE_TERRAIN.
+        """
+        xs = np.asarray(xs, dtype=np.int64).ravel()
+        ys = np.asarray(ys, dtype=np.int64).ravel()
+        inside = (xs >= 0) & (xs < self.width) & (ys >= 0) & (ys < self.height)
+        values = np.full(len(xs), OUTSIDE_TERRAIN, dtype=np.int8)
+        values[inside] = self.terrain_array[ys[inside], xs[inside]]
+        return values
+
+    def get_terrain_window(self, x: int, y: int, radius: int) -> np.ndarray:
+        """Get the (2 * radius + 1) square of terrain values centred on (x, y)"""
+        size = 2 * radius + 1
+        return self.get_terrain_region(x - radius, y - radius, size, size)
+
+    def get_terrain_region(
+        self, left: int, top: int, width: int, height: int
+    ) -> np.ndarray:
+        """
+        Get a (height, width) array of the TerrainType values get_terrain would
+        return, indexed [y - top, x - left]. Cells outside the map read as
+        OUTSIDE_TERRAIN. Regions inside the map are read-only views of
+        terrain_array.
+        """
+        return read_region(
+            self.terrain_array, left, top, width, height, OUTSIDE_TERRAIN
+        )
 
-                # Calculate angle between ant's direction and point
-                # First normalize vectors
-                if distance > 0:
-                    point_dx, point_dy = dx / distance, dy / distance
-                else:
-                    # If distance is 0, point is at ant's position (already handled with continue above)
-                    continue
+    def get_food_values(self, xs, ys) -> np.ndarray:
+        """Get the food amounts at many positions, 0 outside the map"""
+        xs = np.asarray(xs, dtype=np.int64).ravel()
+        ys = np.asarray(ys, dtype=np.int64).ravel()
+        inside = (xs >= 0) & (xs < self.width) & (ys >= 0) & (ys < self.height)
+        values = np.zeros(len(xs), dtype=self.food_array.dtype)
+        values[inside] = self.food_array[ys[inside], xs[inside]]
+        return values
 
-                dir_magnitude = math.sqrt(dir_dx * dir_dx + dir_dy * dir_dy)
-                if dir_magnitude > 0:
-                    dir_dx, dir_dy = dir_dx / dir_magnitude, dir_dy / dir_magnitude
+    def get_food_window(self, x: int, y: int, radius: int) -> np.ndarray:
+        """
+        Get the (2 * radius + 1) square of food amounts centred on (x, y).
 
-                # Calculate dot product
-                dot_product = dir_dx * point_dx + dir_dy * point_dy
+        Windows inside the map are read-only views of food_array.
+        """
+        size = 2 * radius + 1
+        return self.get_food_region(x - radius, y - radius, size, size)
 
-                # Clamp to valid range for acos
-                dot_product = max(-1.0, min(1.0, dot_product))
+    def get_food_region(
+        self, left: int, top: int, width: int, height: int
+    ) -> np.ndarray:
+        """Get a (height, width) array of food amounts, indexed [y - top, x - left]"""
+        return read_region(self.food_array, left, top, width, height, 0)
 
-                # Calculate angle in degrees
-                angle = math.degrees(math.acos(dot_product))
+    def update(self) -> None:
+        if self.pheromones_enabled:
+            self.home_pheromones.evaporate()
+            self.food_pheromones.evaporate()
+            if self.diffusion_rate > 0:
+                open_cells = self.get_open_cells()
+                self.home_pheromones.diffuse(self.diffusion_rate, open_cells)
+                self.food_pheromones.diffuse(self.diffusion_rate, open_cells)
+        if (
+            self.batch_perception
+            or self.decision_workers > 1
+            or self.perception_threads > 1
+        ):
+            # Every ant decides from the same snapshot of the world, so the
+            # actions can be applied afterwards, all at once
+            batch = self.perceive_all() if self.batch_perception else None
+            if self.decision_workers > 1:
+                codes = self.decide_in_workers(batch)
+            else:
+                codes = self.decide_actions(batch)
+            self.population.steps_taken[codes != NO_DECISION] += 1
+            self.apply_actions(codes)
+        else:
+            for index, ant in enumerate(self.ants):
+                perception = self._perceive(ant, index, None)
+                action = ant.decide_action(perception)
+                self.execute_action(ant, action)
+
+        if self.batch_deposits:
+            self.flush_deposits()
+        self.steps += 1
 
-                # Check if angle is within vision field
-                half_vision_angle = ant.vision_angle / 2
-                if angle > half_vision_angle:
-                    continue
+    def decide_actions(self, batch: BatchPerception) -> np.ndarray:
+        """
+        Get the AntAction value each ant of self.ants picks from batch, or
+        NO_DECISION for ants without a strategy. Ants whose strategy has
+        decide_actions decide together when there is a batch, the others one
+        at a time. Without a batch, every ant perceives the world as it is
+        now before any of them decides.
+        """
+        ants = self.ants
+        codes = np.full(len(ants), NO_DECISION, dtype=np.int8)
+
+        def perceive(index):
+            return self._perceive(ants[index], index, batch)
+
+        # Ant indices by batched strategy instance, in order of first appearance
+        members = {}
+        alone = []
+        for index, ant in enumerate(ants):
+            strategy = ant.strategy
+            if not strategy:
+                continue
+            if batch is None or getattr(strategy, "decide_actions", None) is None:
+                alone.append(index)
+            else:
+                members.setdefault(id(strategy), (strategy, []))[1].append(index)
+
+        if self.perception_threads > 1:
+            perceptions = self.perceive_in_threads(alone, batch)
+        elif batch is None:
+            perceptions = [perceive(index) for index in alone]
+        else:
+            # Perceived while deciding, so pooled perceptions can be reused
+            perceptions = map(perceive, alone)
+        for index, perception in zip(alone, perceptions):
+            codes[index] = ants[index].strategy.decide_action(perception).value
+
+        for strategy, indices in members.values():
+            indices = np.array(indices, dtype=np.int64)
+            codes[indices] = strategy.decide_actions(
+                StrategyBatch(batch, indices, perceive)
+            )
+        return codes
+
+    def decide_in_workers(self, batch: Optional[BatchPerception]) -> np.ndarray:
+        """
+        Like decide_actions, with decide_action run by a pool of
+        decision_workers processes. Every perception is built first, from
+        batch when given, and then shipped to the worker of its ant.
+        """
+        ants = self.ants
+        workers = self.decision_workers
+        # Distinct strategy instances, in order of first appearance
+        strategies = []
+        positions = {}
+        deciding, strategy_indices, shards = [], [], []
+        for index, ant in enumerate(ants):
+            strategy = ant.strategy
+            if not strategy:
+                continue
+            position = positions.get(id(strategy))
+            if position is None:
+                position = positions[id(strategy)] = len(strategies)
+                strategies.append(strategy)
+            deciding.append(index)
+            strategy_indices.append(position)
+            shards.append((index if ant.id is None else ant.id) % workers)
+
+        # Forked before any perception thread runs, since a fork only copies
+        # the calling thread and would leave the executor's locks behind
+        pool = self._decision_pool
+        if pool is None or not pool.serves(workers, strategies):
+            if pool is not None:
+                pool.close()
+            self.stop_threads()
+            seed = random.getrandbits(32)
+            pool = self._decision_pool = DecisionPool(workers, strategies, seed)
+
+        # Lazy and pooled perceptions cannot leave this process
+        if self.perception_threads > 1:
+            perceptions = self.perceive_in_threads(deciding, batch)
+        else:
+            perceptions = [
+                self._perceive_plain(ants[index], index, batch) for index in deciding
+            ]
+        codes = np.full(len(ants), NO_DECISION, dtype=np.int8)
+        if deciding:
+            codes[deciding] = pool.decide(shards, strategy_indices, perceptions)
+        return codes
+
+    def perceive_in_threads(
+        self, indices: list, batch: Optional[BatchPerception] = None
+    ) -> list:
+        """
+        Build the AntPerception of self.ants[i] for every i in indices, from
+        batch when given, with the ants split into perception_threads chunks
+        built by a pool of threads.
+
+        Building a perception only reads the world, so the chunks need no
+        locking as long as nothing else changes the environment meanwhile.
+        The state read is: the terrain (grid, grid_array, terrain,
+        terrain_array, colony_mask), the food (food_amounts, food_array), both
+        pheromone maps, the ants (self.ants, population and the occupancy
+        index) and batch. The memo tables filled on the way, vision stencils,
+        line-of-sight regions and strategy needs, only ever gain complete
+        entries that any thread would compute the same, so a race at worst
+        builds one twice. Lazy, pooled and incremental perceptions update
+        shared counters and caches, so plain perceptions are built instead.
+
+        Under the GIL, threads only overlap while NumPy kernels run, which
+        mostly helps batch perception. Free-threaded builds run the chunks
+        fully in parallel.
+        """
+        threads = self.perception_threads
+        if self._perception_executor is None or self._perception_executor[0] != threads:
+            self.stop_threads()
+            self._perception_executor = (threads, ThreadPoolExecutor(threads))
+        ants = self.ants
+
+        def build(chunk):
+            return [self._perceive_plain(ants[index], index, batch) for index in chunk]
+
+        size = -(-len(indices) // threads) or 1
+        chunks = [
+            indices[start : start + size] for start in range(0, len(indices), size)
+        ]
+        perceptions = []
+        for built in self._perception_executor[1].map(build, chunks):
+            perceptions.extend(built)
+        return perceptions
+
+    def _perceive_plain(
+        self, ant: Ant, index: int, batch: Optional[BatchPerception]
+    ) -> AntPerception:
+        """Perception of self.ants[index] as an AntPerception, without caches"""
+        if batch is not None:
+            return batch.get_perception(index)
+        return self.get_perception_for_ant(ant, lazy=False, incremental=False)
+
+    def stop_threads(self) -> None:
+        """Stop the perception_threads threads, restarted by the next update"""
+        if self._perception_executor is not None:
+            self._perception_executor[1].shutdown()
+            self._perception_executor = None
+
+    def stop_workers(self) -> None:
+        """
+        Stop the decision_workers processes and perception_threads threads,
+        restarted by the next update
+        """
+        if self._decision_pool is not None:
+            self._decision_pool.close()
+            self._decision_pool = None
+        self.stop_threads()
+
+    def flush_deposits(self) -> None:
+        """Apply the deposits collected while batch_deposits is on"""
+        for pheromones, deposits in (
+            (self.home_pheromones, self._home_deposits),
+            (self.food_pheromones, self._food_deposits),
+        ):
+            if deposits[0]:
+                pheromones.add_pheromones(*deposits)
+                for buffer in deposits:
+                    buffer.clear()
 
-                is_blocked = False
+    def perceive_all(self, ants: Optional[list] = None) -> BatchPerception:
+        """
+        Compute the perception of many ants (all by default) from the current
+        state of the world. The returned batch is reused by the next call.
+        """
+        ants = self.ants if ants is None else ants
+        needs = [self.get_perception_needs(ant) for ant in ants]
+        self._perception_batch.compute(self, ants, self._line_of_sight, needs)
+        return self._perception_batch
+
+    def _perceive(
+        self, ant: Ant, index: int, batch: Optional[BatchPerception]
+    ) -> AntPerception:
+        """Perception of self.ants[index] for update(), in the configured mode"""
+        if self.pooled_perception:
+            pool = self._perception_pool
+            while len(pool) <= index:
+                pool.append(CompactAntPerception())
+            perception = pool[index]
+            if batch is not None:
+                perception.load_batch(batch, index)
+            else:
+                fields, vision_range = self.get_perception_needs(ant)
+                current_terrain = self.get_terrain(int(ant.x), int(ant.y))
+                cells = self.get_visible_cells(ant, vision_range) if fields else []
+                perception.load_cells(self, ant, current_terrain, cells, fields)
+            return perception
+
+        if batch is None:
+            return self.get_perception_for_ant(ant)
+        if self.lazy_perception:
+            self.perception_usage["perceptions"] += 1
+            return batch.get_lazy_perception(index, self.perception_usage)
+        return batch.get_perception(index)
+
+    def get_perception_needs(self, ant: Ant) -> tuple:
+        """
+        Get the PERCEPTION_FIELDS the ant's strategy reads and the range it
+        looks over, 0 when it only looks at its own cell
+        """
+        fields, cone = get_strategy_needs(ant.strategy)
+        return fields, ant.vision_range if cone else 0
+
+    def get_perception_for_ant(
+        self,
+        ant: Ant,
+        lazy: Optional[bool] = None,
+        incremental: Optional[bool] = None,
+    ) -> AntPerception:
+        """
+        Perceive the world for one ant. lazy and incremental override
+        lazy_perception and incremental_perception for this call.
+        """
+        lazy = self.lazy_perception if lazy is None else lazy
+        if incremental is None:
+            incremental = self.incremental_perception
+        fields, vision_range = self.get_perception_needs(ant)
+        current_terrain = self.get_terrain(int(ant.x), int(ant.y))
+        if fields and incremental:
+            source = self.perception_cache.get_source(
+                self, ant, current_terrain, vision_range
+            )
+        else:
+            cells = self.get_visible_cells(ant, vision_range) if fields else []
+            source = VisibleCellSource(self, ant, current_terrain, cells)
+
+        if lazy:
+            self.perception_usage["perceptions"] += 1
+            perception = LazyAntPerception(
+                source, usage=self.perception_usage, fields=fields
+            )
+        else:
+            # Fields the strategy did not declare keep their empty defaults
+            perception = AntPerception()
+            for name in fields:
+                setattr(perception, name, source.materialize(name))
+            perception.summarize()
+        copy_ant_state(perception, ant)
+        return perception
 
-                # Simple line-of-sight check
+    def get_visible_cells(self, ant: Ant, vision_range: Optional[int] = None) -> list:
+        """
+        Get ((dx, dy), x, y) for every map cell the ant sees, besides its own,
+        optionally over a shorter range than its own vision_range
+        """
+        if vision_range is None:
+            vision_range = ant.vision_range
+        # Visible offsets and their line-of-sight cells only depend on the cone
+        stencil = get_vision_stencil(ant.direction, vision_range, ant.vision_angle)
+        x, y = int(ant.x), int(ant.y)
+        blocked = self._line_of_sight.blocked_rays(stencil, x, y)
+        cells = []
+        for dx, dy in stencil.offsets:
+            check_x = x + dx
+            check_y = y + dy
+
+            blocked, is_blocked = blocked >> 1, blocked & 1
+            if is_blocked:
+                continue
+
+            # If valid position and not blocked, add to visible cells
+            if self.is_valid_position(check_x, check_y):
+                cells.append(((dx, dy), check_x, check_y))
+        return cells
+
+    def _is_line_blocked(self, x: int, y: int, line: tuple, exact: bool) -> bool:
+        """Check the line-of-sight cells of a VisionStencil ray for walls"""
+        grid = self.grid
+        wall = TerrainType.WALL.value
+        width, height = self.width, self.height
+        if exact:
+            for ox, oy, fix_x, fix_y in line:
+                check_x = x + ox
+                check_y = y + oy
+                # int() in the original check truncates towards zero
+                if check_x < 0:
+                    check_x += fix_x
+                if check_y < 0:
+                    check_y += fix_y
                 if (
-                    abs(dx) > 1 or abs(dy) > 1
-                ):  # Skip line-of-sight check for adjacent cells (they're always visible)
-                    # Calculate steps for line-of-sight check
-                    steps = max(abs(dx), abs(dy))
-                    step_x = dx / steps
-                    step_y = dy / steps
-
-                    # Check each step along the line of sight
-                    for step in range(1, steps):
-                        check_step_x = int(ant.x + step * step_x)
-                        check_step_y = int(ant.y + step * step_y)
-
-                        if (
-                            self.is_valid_position(check_step_x, check_step_y)
-                            and self.grid[check_step_y][check_step_x]
-                            == TerrainType.WALL.value
-                        ):
-                            is_blocked = True
-                            break
-
-                if is_blocked:
-                    continue
-
-                # If valid position and not blocked, add to visible cells
-                if self.is_valid_position(check_x, check_y):
-                    terrain = self.grid[check_y][check_x]
-                    # Convert integer value to TerrainType enum for consistency
-                    perception.visible_cells[(dx, dy)] = TerrainType(terrain)
-
-                    # Also add pheromone information
-                    perception.food_pheromone[(dx, dy)] = (
-                        self.food_pheromones.get_value(check_x, check_y)
-                    )
-                    perception.home_pheromone[(dx, dy)] = (
-                        self.home_pheromones.get_value(check_x, check_y)
-                    )
-
-                    # Check for other ants
-                    for other_ant in self.ants:
-                        if (
-                            other_ant != ant
-                            and int(other_ant.x) == check_x
-                            and int(other_ant.y) == check_y
-                        ):
-                            perception.nearby_ants.append(
-                                ((dx, dy), other_ant.has_food)
-                            )
-                            break
-        return perception
+                    0 <= check_x < width
+                    and 0 <= check_y < height
+                    and grid[check_y][check_x] == wall
+                ):
+                    return True
+        else:
+            for step_x, step_y in line:
+                check_x = int(x + step_x)
+                check_y = int(y + step_y)
+                if (
+                    0 <= check_x < width
+                    and 0 <= check_y < height
+                    and grid[check_y][check_x] == wall
+                ):
+                    return True
+        return False
 
     def execute_action(self, ant: "Ant", action: "AntAction") -> bool:
         if action == AntAction.MOVE_FORWARD:
@@ -309,7 +727,10 @@ class Environment:
             new_x, new_y = ant.x + dx, ant.y + dy
 
             success = self.is_walkable(int(new_x), int(new_y))
+            old_cell = (int(ant.x), int(ant.y))
             ant.move_forward(success)
+            if success and ant in self._ant_index:
+                self._move_occupant(ant, old_cell, (int(ant.x), int(ant.y)))
             return success
 
         elif action == AntAction.TURN_LEFT:
@@ -360,14 +781,20 @@ class Environment:
         elif action == AntAction.DEPOSIT_HOME_PHEROMONE:
             if self.pheromones_enabled:
                 amount = ant.deposit_pheromone()
-                self.home_pheromones.add_pheromone(int(ant.x), int(ant.y), amount)
+                if self.batch_deposits:
+                    self._buffer_deposit(self._home_deposits, ant, amount)
+                else:
+                    self.home_pheromones.add_pheromone(int(ant.x), int(ant.y), amount)
                 return True
             return False
 
         elif action == AntAction.DEPOSIT_FOOD_PHEROMONE:
             if self.pheromones_enabled:
                 amount = ant.deposit_pheromone()
-                self.food_pheromones.add_pheromone(int(ant.x), int(ant.y), amount)
+                if self.batch_deposits:
+                    self._buffer_deposit(self._food_deposits, ant, amount)
+                else:
+                    self.food_pheromones.add_pheromone(int(ant.x), int(ant.y), amount)
                 return True
             return False
 
@@ -376,6 +803,122 @@ class Environment:
 
         return False
 
+    def apply_actions(self, codes: np.ndarray) -> None:
+        """
+        Apply one action per ant with whole-array operations, codes[i] being
+        the AntAction value for self.ants[i]. Same result as execute_action
+        for each ant in order: moves, turns and deposits only depend on the
+        ant itself, and the food on a cell goes to the lowest indices first.
+        """
+        population = self.population
+        xs, ys = population.x, population.y
+        directions = population.direction
+        has_food = population.has_food
+
+        moving = np.flatnonzero(codes == AntAction.MOVE_FORWARD.value)
+        if len(moving):
+            old_xs, old_ys = xs[moving], ys[moving]
+            new_xs = old_xs + DIRECTION_DX[directions[moving]]
+            new_ys = old_ys + DIRECTION_DY[directions[moving]]
+            # As is_walkable, which reads the grid without the colony footprints
+            walkable = (
+                (new_xs >= 0)
+                & (new_xs < self.width)
+                & (new_ys >= 0)
+                & (new_ys < self.height)
+            )
+            walkable[walkable] = (
+                self.grid_array[new_ys[walkable], new_xs[walkable]]
+                != TerrainType.WALL.value
+            )
+            moved = moving[walkable]
+            old_cells = zip(old_xs[walkable].tolist(), old_ys[walkable].tolist())
+            new_xs, new_ys = new_xs[walkable], new_ys[walkable]
+            xs[moved], ys[moved] = new_xs, new_ys
+            if len(moved) > len(self.ants) // 16:
+                # Cheaper than updating the crowded cells one ant at a time
+                self._index_occupancy()
+            else:
+                ants = self.ants
+                for index, old_cell, new_cell in zip(
+                    moved.tolist(), old_cells, zip(new_xs.tolist(), new_ys.tolist())
+                ):
+                    self._move_occupant(ants[index], old_cell, new_cell)
+
+        turning = codes == AntAction.TURN_LEFT.value
+        directions[turning] = (directions[turning] - 1) % 8
+        turning = codes == AntAction.TURN_RIGHT.value
+        directions[turning] = (directions[turning] + 1) % 8
+
+        picking = np.flatnonzero((codes == AntAction.PICK_UP_FOOD.value) & ~has_food)
+        if len(picking):
+            terrain = self.get_terrain_values(xs[picking], ys[picking])
+            picking = picking[terrain == TerrainType.FOOD.value]
+            # Rank of each ant among the ants picking on its cell, by index
+            cells = ys[picking] * self.width + xs[picking]
+            order = np.argsort(cells, kind="stable")
+            sorted_cells = cells[order]
+            starts = np.searchsorted(sorted_cells, sorted_cells)
+            ranks = np.empty(len(picking), dtype=np.int64)
+            ranks[order] = np.arange(len(picking)) - starts
+            lucky = ranks < self.food_array[ys[picking], xs[picking]]
+            picked = picking[lucky]
+            for x, y in zip(xs[picked].tolist(), ys[picked].tolist()):
+                self.remove_food(x, y)
+            has_food[picked] = True
+
+        dropping = np.flatnonzero((codes == AntAction.DROP_FOOD.value) & has_food)
+        if len(dropping):
+            terrain = self.get_terrain_values(xs[dropping], ys[dropping])
+            dropped = dropping[terrain == TerrainType.COLONY.value]
+            self.food_collected += len(dropped)
+            has_food[dropped] = False
+            population.food_collected[dropped] += 1
+            population.home_pheromone[dropped] = 100.0
+            population.food_pheromone[dropped] = 100.0
+
+        if not self.pheromones_enabled:
+            return
+        for code, pheromones, deposits in (
+            (
+                AntAction.DEPOSIT_HOME_PHEROMONE.value,
+                self.home_pheromones,
+                self._home_deposits,
+            ),
+            (
+                AntAction.DEPOSIT_FOOD_PHEROMONE.value,
+                self.food_pheromones,
+                self._food_deposits,
+            ),
+        ):
+            depositing = np.flatnonzero(codes == code)
+            if not len(depositing):
+                continue
+            # Each ant spends the level of the trail it is laying, see
+            # Ant.deposit_pheromone
+            carrying = has_food[depositing]
+            levels = np.where(
+                carrying,
+                population.food_pheromone[depositing],
+                population.home_pheromone[depositing],
+            )
+            rates = population.pheromone_decrease_rate[depositing]
+            population.food_pheromone[depositing[carrying]] *= rates[carrying]
+            population.home_pheromone[depositing[~carrying]] *= rates[~carrying]
+            if self.batch_deposits:
+                for buffer, values in zip(
+                    deposits, (xs[depositing], ys[depositing], levels)
+                ):
+                    buffer.extend(values.tolist())
+            else:
+                pheromones.add_pheromones(xs[depositing], ys[depositing], levels)
+
+    def _buffer_deposit(self, deposits: tuple, ant: Ant, amount: float) -> None:
+        xs, ys, amounts = deposits
+        xs.append(int(ant.x))
+        ys.append(int(ant.y))
+        amounts.append(amount)
+
     def is_complete(self) -> bool:
         return (
             self.food_collected >= self.initial_food_amount
@@ -475,6 +1018,33 @@ class EnvironmentBuilder:
 
         return env
 
+    @staticmethod
+    def create_from_arrays(
+        grid: np.ndarray,
+        food: np.ndarray,
+        colony_mask: np.ndarray,
+        pheromone_backend: str = "dict",
+        track_pheromone_changes: bool = True,
+    ) -> Environment:
+        """
+        Create an environment from the grid_array, food_array and colony_mask
+        of another one, or slices of them. Colony footprints are taken from
+        colony_mask as is, so footprints cut by the edge of a slice survive.
+        """
+        height, width = grid.shape
+        env = Environment(width, height, pheromone_backend, track_pheromone_changes)
+        for y, x in np.argwhere(grid == TerrainType.WALL.value).tolist():
+            env.add_wall(x, y)
+        for y, x in np.argwhere(grid == TerrainType.FOOD.value).tolist():
+            env.add_food(x, y, int(food[y, x]))
+        for y, x in np.argwhere(grid == TerrainType.COLONY.value).tolist():
+            env._set_cell(x, y, TerrainType.COLONY.value)
+            env.colony_positions.append((x, y))
+        env.colony_mask[...] = colony_mask
+        for y, x in np.argwhere(colony_mask).tolist():
+            env._update_terrain(x, y)
+        return env
+
     @staticmethod
     def load_from_file(filename: str, verbose: bool = True) -> Optional[Environment]:
         """Load environment configuration from file
@@ -487,6 +1057,7 @@ class EnvironmentBuilder:
         - ANTS: count (for specifying the number of ants to create)
         - TIME_LIMIT: seconds (for specifying simulation time limit in seconds)
         - MAX_STEPS: steps (for specifying maximum simulation steps)
+        - DIFFUSION: rate (for pheromone diffusion per step, 0 to 1, 0 disables)
 
         Example:
         ```
@@ -506,6 +1077,8 @@ class EnvironmentBuilder:
         60
         MAX_STEPS:
         10000
+        DIFFUSION:
+        0.1
         ```
         """
         try:
@@ -518,6 +1091,7 @@ class EnvironmentBuilder:
                 ant_count = 0
                 time_limit = 0  # Default: no time limit
                 max_steps = 0  # Default: no step limit
+                diffusion_rate = 0.0  # Default: no diffusion
 
                 for line in lines:
                     line = line.strip()
@@ -582,6 +1156,17 @@ class EnvironmentBuilder:
                         except ValueError:
                             if verbose:
                                 print(f"Invalid max steps: {line}")
+                    elif current_section == "DIFFUSION":
+                        try:
+                            rate = float(line.strip())
+                            if not 0.0 <= rate <= 1.0:
+                                raise ValueError(line)
+                            diffusion_rate = rate
+                            if verbose:
+                                print(f"Environment diffusion rate: {diffusion_rate}")
+                        except ValueError:
+                            if verbose:
+                                print(f"Invalid diffusion rate: {line}")
 
                 if env is None:
                     env = Environment(width, height)
@@ -599,6 +1184,7 @@ class EnvironmentBuilder:
                 # Store time limit and max steps as environment attributes
                 env.time_limit = time_limit
                 env.max_steps = max_steps
+                env.diffusion_rate = diffusion_rate
 
                 return env
         except Exception as e:
@@ -651,6 +1237,11 @@ class EnvironmentBuilder:
                     f.write("MAX_STEPS:\n")
                     f.write(f"{env.max_steps}\n\n")
 
+                # Write diffusion rate if it's set
+                if env.diffusion_rate > 0:
+                    f.write("DIFFUSION:\n")
+                    f.write(f"{env.diffusion_rate}\n\n")
+
                 return True
         except Exception as e:
             print(f"Error saving environment to file: {e}")
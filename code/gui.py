@@ -2,9 +2,11 @@ import pygame
 import sys
 import time
 import argparse
+import numpy as np
 
 from environment import Environment, TerrainType, Direction
 from utils import create_environment, add_ants
+from pheromones import PHEROMONE_BACKENDS
 
 # Colors - using the exact same colors as in improved_ant.py
 BLACK = (0, 0, 0)
@@ -20,6 +22,9 @@ FOOD_COLOR = (158, 55, 17)
 HOME_R, HOME_G, HOME_B = 96, 85, 33
 FOOD_R, FOOD_G, FOOD_B = 255, 255, 255
 
+# Pheromone layer pixels that show the dirt and grid beneath, never a cell color
+LAYER_COLORKEY = BLACK
+
 
 class AntSimulationGUI:
     def __init__(
@@ -66,13 +71,17 @@ class AntSimulationGUI:
         self.main_surface = pygame.Surface((self.width, self.height))
         self.main_surface.fill(DIRT_COLOR)
 
+        # Pheromones and terrain, repainted only where they changed
+        self.pheromone_layer = pygame.Surface((self.width, self.height))
+        self.pheromone_layer.set_colorkey(LAYER_COLORKEY)
+        self.layer_maps = None
+        self.layer_terrain = None
+
         self.font = pygame.font.SysFont("Arial", 18)
         self.clock = pygame.time.Clock()
 
         # Track last known positions for incremental updates
         self.last_food_positions = set()
-        self.last_home_pheromones = set()
-        self.last_food_pheromones = set()
 
     def run(self) -> None:
         running = True
@@ -136,9 +145,7 @@ class AntSimulationGUI:
                         if self.initial_food > 0
                         else 0
                     )
-                    ants_with_food = sum(
-                        1 for ant in self.environment.ants if ant.has_food
-                    )
+                    ants_with_food = self.environment.population.count_with_food()
 
                     print(
                         f"Step {self.step_count}: "
@@ -234,122 +241,105 @@ class AntSimulationGUI:
         pygame.display.flip()
 
     def render_basic_terrain(self) -> None:
-        for x in range(self.environment.width):
-            for y in range(self.environment.height):
-                terrain = self.environment.get_terrain(x, y)
-                if terrain == TerrainType.FOOD:
-                    pygame.draw.rect(
-                        self.main_surface,
-                        FOOD_COLOR,
-                        (
-                            x * self.cell_size,
-                            y * self.cell_size,
-                            self.cell_size,
-                            self.cell_size,
-                        ),
-                    )
-                elif terrain == TerrainType.COLONY:
-                    pygame.draw.rect(
-                        self.main_surface,
-                        (HOME_R, HOME_G, HOME_B),
-                        (
-                            x * self.cell_size,
-                            y * self.cell_size,
-                            self.cell_size,
-                            self.cell_size,
-                        ),
-                    )
-                elif terrain == TerrainType.WALL:
-                    pygame.draw.rect(
-                        self.main_surface,
-                        GRAY,
-                        (
-                            x * self.cell_size,
-                            y * self.cell_size,
-                            self.cell_size,
-                            self.cell_size,
-                        ),
-                    )
+        terrain = self.environment.get_terrain_region(
+            0, 0, self.environment.width, self.environment.height
+        )
+        colors = np.zeros(terrain.shape + (3,), dtype=np.uint8)
+        self.fill_terrain_colors(colors, terrain)
+        self.blit_cells(colors, terrain != TerrainType.EMPTY.value)
 
     def render_pixel_perfect(self) -> None:
-        max_pheromone = 100.0
+        self.update_pheromone_layer()
+        self.main_surface.blit(self.pheromone_layer, (0, 0))
 
-        for y in range(self.environment.height):
-            for x in range(self.environment.width):
-                terrain = self.environment.get_terrain(x, y)
-                if terrain == TerrainType.FOOD:
-                    pygame.draw.rect(
-                        self.main_surface,
-                        FOOD_COLOR,
-                        (
-                            x * self.cell_size,
-                            y * self.cell_size,
-                            self.cell_size,
-                            self.cell_size,
-                        ),
-                    )
-                    continue
-
-                # Draw colony
-                if terrain == TerrainType.COLONY:
-                    pygame.draw.rect(
-                        self.main_surface,
-                        (HOME_R, HOME_G, HOME_B),
-                        (
-                            x * self.cell_size,
-                            y * self.cell_size,
-                            self.cell_size,
-                            self.cell_size,
-                        ),
-                    )
-                    continue
-
-                # Draw walls
-                if terrain == TerrainType.WALL:
-                    pygame.draw.rect(
-                        self.main_surface,
-                        GRAY,
-                        (
-                            x * self.cell_size,
-                            y * self.cell_size,
-                            self.cell_size,
-                            self.cell_size,
-                        ),
-                    )
-                    continue
-
-                # Get pheromone values
-                home_val = self.environment.home_pheromones.get_value(x, y)
-                food_val = self.environment.food_pheromones.get_value(x, y)
-
-                # Skip pixels with no pheromones
-                if home_val == 0 and food_val == 0:
-                    continue
+    def update_pheromone_layer(self) -> None:
+        """Repaint the layer cells whose pheromones or terrain changed since last frame"""
+        env = self.environment
+        maps = (env.home_pheromones, env.food_pheromones)
+        terrain = env.get_terrain_region(0, 0, env.width, env.height)
 
-                # Calculate percentages
-                home_pct = min(1.0, home_val / max_pheromone)
-                food_pct = min(1.0, food_val / max_pheromone)
+        changed = set()
+        for pheromones in maps:
+            changed |= pheromones.drain_dirty()
 
-                # Calculate blended color, exactly like in improved_ant.py
-                pixel_r = int(HOME_R * home_pct + DIRT_R * (1 - home_pct))
-                pixel_g = int(HOME_G * home_pct + DIRT_G * (1 - home_pct))
-                pixel_b = int(HOME_B * home_pct + DIRT_B * (1 - home_pct))
+        if (
+            self.layer_terrain is None
+            or any(a is not b for a, b in zip(maps, self.layer_maps))
+            or not all(
+                pheromones.track_changes and pheromones.reports_decay
+                for pheromones in maps
+            )
+        ):
+            # First frame, new maps or maps hiding some changes: repaint every cell
+            ys, xs = np.indices(terrain.shape).reshape(2, -1)
+        else:
+            ys, xs = np.nonzero(terrain != self.layer_terrain)
+            if changed:
+                cells = np.array(list(changed), dtype=np.int64)
+                xs = np.concatenate((xs, cells[:, 0]))
+                ys = np.concatenate((ys, cells[:, 1]))
+        self.layer_maps = maps
+        self.layer_terrain = terrain
+        if not len(xs):
+            return
+
+        home_val = maps[0].get_values(xs, ys)
+        food_val = maps[1].get_values(xs, ys)
+        colors = self.pheromone_colors(home_val, food_val)
+
+        # Terrain is drawn over pheromones, and cells with neither are see-through
+        cell_terrain = terrain[ys, xs]
+        self.fill_terrain_colors(colors, cell_terrain)
+        colors[
+            (cell_terrain == TerrainType.EMPTY.value)
+            & (home_val == 0)
+            & (food_val == 0)
+        ] = LAYER_COLORKEY
+        self.paint_cells(self.pheromone_layer, xs, ys, colors)
+
+    @staticmethod
+    def pheromone_colors(home_val: np.ndarray, food_val: np.ndarray) -> np.ndarray:
+        """Colors, with a trailing RGB axis, for cells holding the given pheromones"""
+        max_pheromone = 100.0
 
-                pixel_r = int(FOOD_R * food_pct + pixel_r * (1 - food_pct))
-                pixel_g = int(FOOD_G * food_pct + pixel_g * (1 - food_pct))
-                pixel_b = int(FOOD_B * food_pct + pixel_b * (1 - food_pct))
-
-                # Draw the pixel
-                pygame.draw.rect(
-                    self.main_surface,
-                    (pixel_r, pixel_g, pixel_b),
-                    (
-                        x * self.cell_size,
-                        y * self.cell_size,
-                        self.cell_size,
-                        self.cell_size,
-                    ),
-                )
+        # Calculate percentages
+        home_pct = np.minimum(1.0, home_val / max_pheromone)[..., None]
+        food_pct = np.minimum(1.0, food_val / max_pheromone)[..., None]
+
+        # Calculate blended color, exactly like in improved_ant.py
+        home = np.array([HOME_R, HOME_G, HOME_B])
+        dirt = np.array([DIRT_R, DIRT_G, DIRT_B])
+        food = np.array([FOOD_R, FOOD_G, FOOD_B])
+        pixel = (home * home_pct + dirt * (1 - home_pct)).astype(np.int64)
+        pixel = (food * food_pct + pixel * (1 - food_pct)).astype(np.int64)
+        return pixel.astype(np.uint8)
+
+    @staticmethod
+    def fill_terrain_colors(colors: np.ndarray, terrain: np.ndarray) -> None:
+        colors[terrain == TerrainType.FOOD.value] = FOOD_COLOR
+        colors[terrain == TerrainType.COLONY.value] = (HOME_R, HOME_G, HOME_B)
+        colors[terrain == TerrainType.WALL.value] = GRAY
+
+    def blit_cells(self, colors: np.ndarray, mask: np.ndarray) -> None:
+        """Paint the masked cells of a (height, width, 3) color array in one pass"""
+        if self.cell_size > 1:
+            colors = colors.repeat(self.cell_size, 0).repeat(self.cell_size, 1)
+            mask = mask.repeat(self.cell_size, 0).repeat(self.cell_size, 1)
+        # surfarray pixels are indexed [x, y], and lock the surface while alive
+        pixels = pygame.surfarray.pixels3d(self.main_surface)
+        pixels[mask.T] = colors.transpose(1, 0, 2)[mask.T]
+        del pixels
+
+    def paint_cells(
+        self, surface: pygame.Surface, xs: np.ndarray, ys: np.ndarray, colors
+    ) -> None:
+        """Paint colors[i] over the whole cell at (xs[i], ys[i]) of surface"""
+        offsets = np.arange(self.cell_size)
+        px = xs[:, None, None] * self.cell_size + offsets[:, None]
+        py = ys[:, None, None] * self.cell_size + offsets[None, :]
+        pixels = pygame.surfarray.pixels3d(surface)
+        pixels[px, py] = colors[:, None, None]
+        del pixels
 
     def render_ants(self) -> None:
         for ant in self.environment.ants:
@@ -388,7 +378,7 @@ class AntSimulationGUI:
         )
 
         total_ants = len(self.environment.ants)
-        ants_with_food = sum(1 for ant in self.environment.ants if ant.has_food)
+        ants_with_food = self.environment.population.count_with_food()
         food_collected = self.environment.food_collected
         total_food = self.environment.initial_food_amount
 
@@ -506,6 +496,38 @@ def main():
         help="Time limit in seconds (0 = no limit) (default: 0) - command line value takes precedence over environment file",
     )
     parser.add_argument("--quiet", action="store_true", help="Suppress progress output")
+    parser.add_argument(
+        "--pheromone-backend",
+        type=str,
+        choices=["auto", *PHEROMONE_BACKENDS],
+        default="auto",
+        help="Pheromone storage backend (auto picks one from the map size) (default: auto)",
+    )
+    parser.add_argument(
+        "--batch-deposits",
+        action="store_true",
+        help="Apply pheromone deposits once at the end of each step instead of immediately",
+    )
+    parser.add_argument(
+        "--batch-perception",
+        action="store_true",
+        help="Compute the perception of all ants together at the start of each step",
+    )
+    parser.add_argument(
+        "--lazy-perception",
+        action="store_true",
+        help="Build perception fields only when a strategy reads them",
+    )
+    parser.add_argument(
+        "--pooled-perception",
+        action="store_true",
+        help="Reuse compact perception objects across steps instead of allocating new ones",
+    )
+    parser.add_argument(
+        "--incremental-perception",
+        action="store_true",
+        help="Reuse the perception of ants that did not move, refreshing only what changed",
+    )
     parser.add_argument(
         "--progress-interval",
         type=int,
@@ -515,7 +537,12 @@ def main():
     args = parser.parse_args()
 
     try:
-        environment = create_environment(args.env, args.width, args.height)
+        environment = create_environment(
+            args.env,
+            args.width,
+            args.height,
+            pheromone_backend=args.pheromone_backend,
+        )
 
         # Check if environment file specified a number of ants
         ant_count = args.ants
@@ -550,6 +577,12 @@ def main():
             if not args.quiet:
                 print(f"Using max steps from environment file: {max_steps} steps")
 
+        environment.batch_deposits = args.batch_deposits
+        environment.batch_perception = args.batch_perception
+        environment.lazy_perception = args.lazy_perception
+        environment.pooled_perception = args.pooled_perception
+        environment.incremental_perception = args.incremental_perception
+
         add_ants(environment, args.strategy, args.strategy_file, ant_count)
 
         gui = AntSimulationGUI(
@@ -0,0 +1,115 @@
+import multiprocessing
+import random
+from typing import List
+
+import numpy as np
+
+
+def _serve_decisions(connection, strategies: list, seed: int) -> None:
+    """
+    Worker loop: receive (strategy indices, perceptions) and send back the
+    AntAction value decide_action picks for each, until None arrives.
+    """
+    random.seed(seed)
+    while True:
+        message = connection.recv()
+        if message is None:
+            break
+        strategy_indices, perceptions = message
+        try:
+            codes = [
+                strategies[strategy].decide_action(perception).value
+                for strategy, perception in zip(strategy_indices, perceptions)
+            ]
+        except Exception as error:
+            connection.send(error)
+        else:
+            connection.send(codes)
+    connection.close()
+
+
+class DecisionPool:
+    """
+    Worker processes calling decide_action for shards of the ants.
+
+    Ant i always goes to worker id % workers (or i % workers without an id),
+    and every worker holds its own copy of the strategies, taken when the pool
+    starts. Per-ant state that a strategy keeps by ant_id therefore stays in
+    one worker from step to step. Each worker seeds random from seed plus its
+    index, so runs are reproducible for a given seed and number of workers.
+
+    Workers are forked where the platform allows it. Elsewhere strategies
+    are pickled, which needs their module to be importable by name.
+    """
+
+    def __init__(self, workers: int, strategies: List, seed: int):
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context("fork" if "fork" in methods else None)
+        self.workers = workers
+        self.strategies = strategies
+        self.connections = []
+        self.processes = []
+        for worker in range(workers):
+            connection, child_connection = context.Pipe()
+            process = context.Process(
+                target=_serve_decisions,
+                args=(child_connection, strategies, seed + worker),
+                daemon=True,
+            )
+            process.start()
+            child_connection.close()
+            self.connections.append(connection)
+            self.processes.append(process)
+
+    def serves(self, workers: int, strategies: List) -> bool:
+        """Whether the pool was started for these workers and strategies"""
+        return (
+            self.workers == workers
+            and len(self.strategies) == len(strategies)
+            and all(a is b for a, b in zip(self.strategies, strategies))
+        )
+
+    def decide(
+        self, shards: List[int], strategy_indices: List[int], perceptions: List
+    ) -> np.ndarray:
+        """
+        Get the AntAction value for each perception, computed by worker
+        shards[i] with strategies[strategy_indices[i]]
+        """
+        members = [[] for _ in range(self.workers)]
+        for index, shard in enumerate(shards):
+            members[shard].append(index)
+        # Every worker gets its share before any result is awaited
+        for connection, indices in zip(self.connections, members):
+            connection.send(
+                (
+                    [strategy_indices[index] for index in indices],
+                    [perceptions[index] for index in indices],
+                )
+            )
+        codes = np.empty(len(perceptions), dtype=np.int8)
+        errors = []
+        for connection, indices in zip(self.connections, members):
+            result = connection.recv()
+            if isinstance(result, Exception):
+                errors.append(result)
+            else:
+                codes[indices] = result
+        if errors:
+            raise errors[0]
+        return codes
+
+    def close(self) -> None:
+        """Stop the worker processes"""
+        for connection in self.connections:
+            try:
+                connection.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+            connection.close()
+        for process in self.processes:
+            process.join(timeout=1)
+            if process.is_alive():
+                process.terminate()
+        self.connections = []
+        self.processes = []
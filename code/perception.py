@@ -0,0 +1,992 @@
+from abc import ABC, abstractmethod
+from collections.abc import ItemsView, Mapping, ValuesView
+from typing import Dict, List, Optional, Tuple
+import math
+
+import numpy as np
+
+from common import AntPerception, Direction, TerrainType
+
+
+# Offsets an ant can see for one (direction, vision_range, vision_angle)
+class VisionStencil:
+    """
+    Precomputed vision cone of an ant.
+
+    cells lists (dx, dy, line) for every offset inside the cone, in the order
+    get_perception_for_ant visits them (dx outer, dy inner). line holds the
+    intermediate cells checked for walls, or is empty for adjacent cells.
+
+    When exact is True each line entry is (ox, oy, fix_x, fix_y): the cell is
+    (x + ox, y + oy) for an ant at (x, y), except that a negative coordinate
+    is moved up by fix_x / fix_y, reproducing int() truncating towards zero.
+    Very long rays can land within rounding distance of a cell border, where
+    the truncated cell depends on the ant position. Such stencils have exact
+    set to False and keep the raw (step_x, step_y) float offsets instead.
+    """
+
+    def __init__(self, direction: int, vision_range: int, vision_angle: float):
+        self.direction = direction
+        self.vision_range = vision_range
+        self.vision_angle = vision_angle
+        self.exact = True
+        self.cells = []
+
+        rays = []
+        for dx in range(-vision_range, vision_range + 1):
+            for dy in range(-vision_range, vision_range + 1):
+                if (dx != 0 or dy != 0) and self._in_cone(dx, dy):
+                    rays.append((dx, dy, self._line_steps(dx, dy)))
+
+        for dx, dy, steps in rays:
+            if self.exact:
+                line = tuple(self._exact_step(*step) for step in steps)
+            else:
+                line = steps
+            self.cells.append((dx, dy, line))
+
+        # Offsets as arrays, for gathering many ants at once
+        self.offsets = [(dx, dy) for dx, dy, _ in self.cells]
+        self.dx = np.array([dx for dx, _ in self.offsets], dtype=np.int64)
+        self.dy = np.array([dy for _, dy in self.offsets], dtype=np.int64)
+        self.slot_of = {offset: slot for slot, offset in enumerate(self.offsets)}
+
+    def _in_cone(self, dx: int, dy: int) -> bool:
+        # Same arithmetic as the per-cell check it replaces, so the cone matches
+        distance = math.sqrt(dx * dx + dy * dy)
+        if distance > self.vision_range:
+            return False
+        point_dx, point_dy = dx / distance, dy / distance
+
+        dir_dx, dir_dy = Direction.get_delta(self.direction)
+        dir_magnitude = math.sqrt(dir_dx * dir_dx + dir_dy * dir_dy)
+        if dir_magnitude > 0:
+            dir_dx, dir_dy = dir_dx / dir_magnitude, dir_dy / dir_magnitude
+
+        dot_product = dir_dx * point_dx + dir_dy * point_dy
+        dot_product = max(-1.0, min(1.0, dot_product))
+        angle = math.degrees(math.acos(dot_product))
+        return angle <= self.vision_angle / 2
+
+    def _line_steps(self, dx: int, dy: int) -> tuple:
+        # Adjacent cells are always visible
+        if abs(dx) <= 1 and abs(dy) <= 1:
+            return ()
+        steps = max(abs(dx), abs(dy))
+        step_x = dx / steps
+        step_y = dy / steps
+        offsets = tuple((step * step_x, step * step_y) for step in range(1, steps))
+        for offset in offsets:
+            for value in offset:
+                nearest = round(value)
+                if value != nearest and abs(value - nearest) < 1e-9:
+                    self.exact = False
+        return offsets
+
+    @staticmethod
+    def _exact_step(step_x: float, step_y: float) -> Tuple[int, int, int, int]:
+        ox, oy = math.floor(step_x), math.floor(step_y)
+        return ox, oy, int(step_x != ox), int(step_y != oy)
+
+
+_stencils: Dict[tuple, VisionStencil] = {}
+
+
+def get_vision_stencil(
+    direction: Direction, vision_range: int, vision_angle: float
+) -> VisionStencil:
+    """Get the cached VisionStencil for a vision cone, building it on first use"""
+    direction = direction.value if isinstance(direction, Direction) else direction
+    key = (direction, vision_range, vision_angle)
+    stencil = _stencils.get(key)
+    if stencil is None:
+        stencil = _stencils[key] = VisionStencil(*key)
+    return stencil
+
+
+# Upper bound on the ray checks done to build one line-of-sight cache region
+LINE_OF_SIGHT_REGION_BUDGET = 4096
+
+
+class LineOfSightCache:
+    """
+    Lazily built tables of the vision stencil rays blocked by walls.
+
+    For an ant standing on (x, y), blocked_rays returns a bitmask with bit i
+    set when the line of sight of stencil.cells[i] crosses a wall. Masks are
+    computed for a whole square region of ant cells the first time one of
+    them is asked for, and dropped by invalidate() when a wall is added
+    within vision range of the region. Regions are up to 16 cells wide,
+    narrower for stencils with many rays so a region stays cheap to build.
+    """
+
+    def __init__(self, is_line_blocked):
+        # Callable (x, y, line, exact) -> bool doing the uncached check
+        self.is_line_blocked = is_line_blocked
+        # stencil -> (region size, {(region_x, region_y): [mask per cell]})
+        self.regions = {}
+
+    def blocked_rays(self, stencil: VisionStencil, x: int, y: int) -> int:
+        """Get the bitmask of blocked stencil rays for an ant at (x, y)"""
+        entry = self.regions.get(stencil)
+        if entry is None:
+            entry = self.regions[stencil] = (self._region_size(stencil), {})
+        size, stencil_regions = entry
+        key = (x // size, y // size)
+        masks = stencil_regions.get(key)
+        if masks is None:
+            masks = stencil_regions[key] = self._build_region(stencil, size, *key)
+        return masks[(y % size) * size + x % size]
+
+    @staticmethod
+    def _region_size(stencil: VisionStencil) -> int:
+        ray_checks = sum(len(line) for _, _, line in stencil.cells) or 1
+        size = 16
+        while size > 1 and size * size * ray_checks > LINE_OF_SIGHT_REGION_BUDGET:
+            size //= 2
+        return size
+
+    def _build_region(
+        self, stencil: VisionStencil, size: int, region_x: int, region_y: int
+    ) -> list:
+        rays = [(1 << i, line) for i, (_, _, line) in enumerate(stencil.cells) if line]
+        masks = []
+        for y in range(region_y * size, (region_y + 1) * size):
+            for x in range(region_x * size, (region_x + 1) * size):
+                mask = 0
+                for bit, line in rays:
+                    if self.is_line_blocked(x, y, line, stencil.exact):
+                        mask |= bit
+                masks.append(mask)
+        return masks
+
+    def invalidate(self, x: int, y: int) -> None:
+        """Drop the regions whose masks can depend on cell (x, y)"""
+        for stencil, (size, stencil_regions) in self.regions.items():
+            # Line-of-sight cells stay within vision_range of the ant
+            reach = stencil.vision_range
+            for region_y in range((y - reach) // size, (y + reach) // size + 1):
+                for region_x in range((x - reach) // size, (x + reach) // size + 1):
+                    stencil_regions.pop((region_x, region_y), None)
+
+
+# Rays a blocked-ray bitmask can hold and still fit an int64
+MAX_VECTOR_RAYS = 62
+
+
+class StencilBatch:
+    """
+    Perception arrays for the ants of a BatchPerception sharing one stencil.
+
+    Row r describes ant rows[r], column k the offset stencil.offsets[k].
+    visible marks the cells the ant sees. For those, terrain holds the grid
+    value, home and food the pheromone levels, and neighbor the index of the
+    first other ant on the cell or -1. Cells that are not visible hold -1 and
+    0.0. The arrays are views into buffers reused by later steps.
+    """
+
+    def __init__(self, stencil: VisionStencil):
+        self.stencil = stencil
+        self.rows = np.zeros(0, dtype=np.int64)
+        self._capacity = 0
+        self._reserve(0)
+
+    def _reserve(self, count: int) -> None:
+        if count <= self._capacity and self._capacity:
+            return
+        capacity = max(count, 2 * self._capacity, 16)
+        columns = len(self.stencil.cells)
+        self._visible = np.zeros((capacity, columns), dtype=bool)
+        self._terrain = np.zeros((capacity, columns), dtype=np.int8)
+        self._home = np.zeros((capacity, columns), dtype=np.float64)
+        self._food = np.zeros((capacity, columns), dtype=np.float64)
+        self._neighbor = np.zeros((capacity, columns), dtype=np.int64)
+        self._capacity = capacity
+
+    def resize(self, rows: np.ndarray) -> None:
+        """Take a new set of ant rows and expose buffers of the matching size"""
+        self._reserve(len(rows))
+        count = len(rows)
+        self.rows = rows
+        self.visible = self._visible[:count]
+        self.terrain = self._terrain[:count]
+        self.home = self._home[:count]
+        self.food = self._food[:count]
+        self.neighbor = self._neighbor[:count]
+
+
+class BatchPerception:
+    """
+    Perception of many ants computed together from one snapshot of the world.
+
+    compute() gathers visible terrain, both pheromone layers and neighbouring
+    ants for every ant with array operations over the vision stencils, into
+    StencilBatch arrays that are reused from one step to the next. Ants that
+    share a (direction, vision_range, vision_angle) are processed together.
+    Layers that no ant of a group needs are left empty instead of gathered.
+    get_perception() turns one ant's rows back into the AntPerception that
+    Environment.get_perception_for_ant would build from the same snapshot.
+    """
+
+    def __init__(self):
+        self.ants = []
+        self.batches: Dict[VisionStencil, StencilBatch] = {}
+        self.groups: List[StencilBatch] = []
+        # Position of each ant in its group: (StencilBatch, row)
+        self.locations = []
+        # PERCEPTION_FIELDS built for each ant
+        self.fields = []
+
+    def compute(
+        self,
+        environment,
+        ants: list,
+        line_of_sight: LineOfSightCache,
+        needs: Optional[list] = None,
+    ):
+        """
+        Perceive the world for all ants, as it is now. needs optionally lists
+        (fields, vision_range) for each ant, as Environment.get_perception_needs
+        returns them; by default every ant gets all fields over its own range.
+        """
+        count = len(ants)
+        self.ants = ants
+        if needs is None:
+            needs = [(PERCEPTION_FIELDS, ant.vision_range) for ant in ants]
+        self.fields = [fields for fields, _ in needs]
+        width, height = environment.width, environment.height
+        if ants is environment.ants:
+            # Rows of the environment's population follow the order of its ants,
+            # so copy the columns rather than reading every ant
+            population = environment.population
+            xs = population.x.astype(np.int64)
+            ys = population.y.astype(np.int64)
+            self.has_food = population.has_food.astype(bool)
+        else:
+            xs = np.fromiter((int(ant.x) for ant in ants), dtype=np.int64, count=count)
+            ys = np.fromiter((int(ant.y) for ant in ants), dtype=np.int64, count=count)
+            self.has_food = np.fromiter(
+                (ant.has_food for ant in ants), dtype=bool, count=count
+            )
+        self.xs, self.ys = xs, ys
+        self.current_terrain = environment.get_terrain_values(xs, ys)
+
+        # The two lowest ant indices on each occupied cell, cells sorted by id
+        inside = (xs >= 0) & (xs < width) & (ys >= 0) & (ys < height)
+        cell_ids = np.where(inside, ys * width + xs, -1)
+        order = np.lexsort((np.arange(count), cell_ids))
+        order = order[cell_ids[order] >= 0]
+        occupied, starts, counts = np.unique(
+            cell_ids[order], return_index=True, return_counts=True
+        )
+        first = order[starts]
+        second = np.where(counts > 1, order[np.minimum(starts + 1, len(order) - 1)], -1)
+
+        members = {}
+        for index, (ant, (_, vision_range)) in enumerate(zip(ants, needs)):
+            stencil = get_vision_stencil(ant.direction, vision_range, ant.vision_angle)
+            members.setdefault(stencil, []).append(index)
+
+        self.groups = []
+        self.locations = [None] * count
+        for stencil, indices in members.items():
+            batch = self.batches.get(stencil)
+            if batch is None:
+                batch = self.batches[stencil] = StencilBatch(stencil)
+            rows = np.array(indices, dtype=np.int64)
+            batch.resize(rows)
+            used = set()
+            for index in indices:
+                used.update(self.fields[index])
+            self._fill(batch, environment, line_of_sight, occupied, first, second, used)
+            self.groups.append(batch)
+            for row, index in enumerate(indices):
+                self.locations[index] = (batch, row)
+
+    def _fill(self, batch, environment, line_of_sight, occupied, first, second, used):
+        stencil = batch.stencil
+        rows = batch.rows
+        xs, ys = self.xs[rows], self.ys[rows]
+        width, height = environment.width, environment.height
+        cell_x = xs[:, None] + stencil.dx[None, :]
+        cell_y = ys[:, None] + stencil.dy[None, :]
+
+        # Rays whose line of sight crosses a wall, from the cached bitmasks
+        masks = [
+            line_of_sight.blocked_rays(stencil, x, y)
+            for x, y in zip(xs.tolist(), ys.tolist())
+        ]
+        columns = len(stencil.cells)
+        if columns <= MAX_VECTOR_RAYS:
+            bits = np.array(masks, dtype=np.int64).reshape(-1, 1)
+            blocked = (bits >> np.arange(columns)) & 1 == 1
+        else:
+            blocked = np.array(
+                [[(mask >> k) & 1 for k in range(columns)] for mask in masks],
+                dtype=bool,
+            ).reshape(-1, columns)
+
+        visible = batch.visible
+        np.logical_and(cell_x >= 0, cell_x < width, out=visible)
+        visible &= (cell_y >= 0) & (cell_y < height) & ~blocked
+        seen_x, seen_y = cell_x[visible], cell_y[visible]
+
+        batch.terrain.fill(-1)
+        batch.terrain[visible] = environment.grid_array[seen_y, seen_x]
+        batch.home.fill(0.0)
+        if "home_pheromone" in used:
+            home = environment.home_pheromones.get_values(seen_x, seen_y)
+            batch.home[visible] = home
+        batch.food.fill(0.0)
+        if "food_pheromone" in used:
+            food = environment.food_pheromones.get_values(seen_x, seen_y)
+            batch.food[visible] = food
+
+        # First ant on each seen cell, or the second one when the first is the viewer
+        batch.neighbor.fill(-1)
+        if "nearby_ants" in used and len(occupied):
+            seen_ids = seen_y * width + seen_x
+            slots = np.minimum(np.searchsorted(occupied, seen_ids), len(occupied) - 1)
+            hit = occupied[slots] == seen_ids
+            viewers = np.broadcast_to(rows[:, None], visible.shape)[visible]
+            others = np.where(first[slots] == viewers, second[slots], first[slots])
+            batch.neighbor[visible] = np.where(hit, others, -1)
+
+    def get_perception(self, index: int) -> AntPerception:
+        """Build the AntPerception of ants[index] from the batch arrays"""
+        perception = AntPerception()
+        copy_ant_state(perception, self.ants[index])
+        for name in self.fields[index]:
+            setattr(perception, name, self.materialize(name, index))
+        perception.summarize()
+        return perception
+
+    def get_lazy_perception(
+        self, index: int, usage: Optional[dict] = None
+    ) -> "LazyAntPerception":
+        """Like get_perception, with the perceived fields built on first read"""
+        perception = LazyAntPerception(self, index, usage, self.fields[index])
+        copy_ant_state(perception, self.ants[index])
+        return perception
+
+    def materialize(self, name: str, index: int):
+        """Build one of the PERCEPTION_FIELDS of ants[index]"""
+        batch, row = self.locations[index]
+        offsets = batch.stencil.offsets
+        columns = np.flatnonzero(batch.visible[row]).tolist()
+
+        if name == "visible_cells":
+            cells = {}
+            current_terrain = int(self.current_terrain[index])
+            if current_terrain >= 0:
+                cells[(0, 0)] = TERRAIN_TYPES[current_terrain]
+            terrain = batch.terrain[row].tolist()
+            for column in columns:
+                cells[offsets[column]] = TERRAIN_TYPES[terrain[column]]
+            return cells
+        if name == "food_pheromone" or name == "home_pheromone":
+            layer = batch.food if name == "food_pheromone" else batch.home
+            values = layer[row].tolist()
+            return {offsets[column]: values[column] for column in columns}
+        if name == "nearby_ants":
+            has_food = self.has_food
+            neighbor = batch.neighbor[row].tolist()
+            return [
+                (offsets[column], bool(has_food[neighbor[column]]))
+                for column in columns
+                if neighbor[column] >= 0
+            ]
+        raise ValueError(f"Unknown perception field: {name}")
+
+
+class StrategyBatch:
+    """
+    The ants of a BatchPerception that share one strategy instance, as
+    AntStrategy.decide_actions receives them.
+
+    Position i in the batch is ant indices[i] of the BatchPerception.
+    has_food and current_terrain (a TerrainType value, -1 outside the map)
+    are arrays over the batch, and sees() checks the vision cones of all
+    ants at once. batch[i] builds the perception of the i-th ant, the same
+    one decide_action would get, for decisions that need the full view.
+    """
+
+    def __init__(self, perception: BatchPerception, indices: np.ndarray, perceive):
+        self.perception = perception
+        self.indices = indices
+        self.ants = [perception.ants[index] for index in indices.tolist()]
+        self.has_food = perception.has_food[indices]
+        self.current_terrain = perception.current_terrain[indices]
+        # Builds the perception of the ant at an index of the BatchPerception
+        self._perceive = perceive
+
+    def __len__(self) -> int:
+        return len(self.indices)
+
+    def __getitem__(self, position: int) -> AntPerception:
+        return self._perceive(int(self.indices[position]))
+
+    def __iter__(self):
+        for position in range(len(self)):
+            yield self[position]
+
+    @property
+    def ant_ids(self) -> list:
+        return [ant.id for ant in self.ants]
+
+    def sees(self, terrain: TerrainType, offsets=None) -> np.ndarray:
+        """
+        Get for every ant whether a visible cell of its cone, besides its own
+        cell, holds terrain. offsets is an optional predicate on (dx, dy)
+        limiting the cone cells that count.
+        """
+        seen = np.zeros(len(self.perception.ants), dtype=bool)
+        for batch in self.perception.groups:
+            columns = [
+                column
+                for column, offset in enumerate(batch.stencil.offsets)
+                if offsets is None or offsets(offset)
+            ]
+            if columns:
+                matches = batch.terrain[:, columns] == terrain.value
+                seen[batch.rows] = matches.any(axis=1)
+        return seen[self.indices]
+
+
+class VisibleCellSource:
+    """
+    Builds the perceived fields of one ant from the cells it can see.
+
+    cells lists ((dx, dy), x, y) for every visible cell in stencil order,
+    and current_terrain is the terrain under the ant or None.
+    """
+
+    def __init__(self, environment, ant, current_terrain, cells: list):
+        self.environment = environment
+        self.ant = ant
+        self.current_terrain = current_terrain
+        self.cells = cells
+
+    def materialize(self, name: str, index: int = 0):
+        """Build one of the PERCEPTION_FIELDS for the ant"""
+        environment = self.environment
+        if name == "visible_cells":
+            cells = {}
+            if self.current_terrain is not None:
+                cells[(0, 0)] = self.current_terrain
+            grid = environment.grid
+            for offset, x, y in self.cells:
+                # Convert integer value to TerrainType enum for consistency
+                cells[offset] = TERRAIN_TYPES[grid[y][x]]
+            return cells
+        if name == "food_pheromone" or name == "home_pheromone":
+            if name == "food_pheromone":
+                get_value = environment.food_pheromones.get_value
+            else:
+                get_value = environment.home_pheromones.get_value
+            return {offset: get_value(x, y) for offset, x, y in self.cells}
+        if name == "nearby_ants":
+            nearby_ants = []
+            for offset, x, y in self.cells:
+                other_ant = environment.get_ant_at(x, y, exclude=self.ant)
+                if other_ant is not None:
+                    nearby_ants.append((offset, other_ant.has_food))
+            return nearby_ants
+        raise ValueError(f"Unknown perception field: {name}")
+
+
+class ConeEntry:
+    """Cells and fields an ant perceived from one cell, kept by PerceptionCache"""
+
+    __slots__ = ("position", "stencil", "terrain_stamp", "cells", "values", "stamps")
+
+    def __init__(self, position: tuple, stencil, terrain_stamp: int, cells: list):
+        self.position = position
+        self.stencil = stencil
+        self.terrain_stamp = terrain_stamp
+        self.cells = cells
+        # Built fields by name, and the version stamps of the pheromone ones
+        self.values = {}
+        self.stamps = {}
+
+
+class CachedCellSource(VisibleCellSource):
+    """
+    VisibleCellSource that returns the fields still valid in a ConeEntry and
+    records the fields it builds there. known_terrain holds TerrainTypes by
+    offset that can be reused for visible_cells after a turn.
+    """
+
+    def __init__(
+        self,
+        environment,
+        ant,
+        current_terrain,
+        entry: ConeEntry,
+        known_terrain: Optional[dict] = None,
+    ):
+        super().__init__(environment, ant, current_terrain, entry.cells)
+        self.entry = entry
+        self.known_terrain = known_terrain
+
+    def materialize(self, name: str, index: int = 0):
+        """Build one of the PERCEPTION_FIELDS, or reuse it from the entry"""
+        entry = self.entry
+        value = entry.values.get(name)
+        if value is not None:
+            return value
+        if name == "visible_cells" and self.known_terrain:
+            value = {}
+            if self.current_terrain is not None:
+                value[(0, 0)] = self.current_terrain
+            known_terrain, grid = self.known_terrain, self.environment.grid
+            for offset, x, y in self.cells:
+                terrain = known_terrain.get(offset)
+                if terrain is None:
+                    terrain = TERRAIN_TYPES[grid[y][x]]
+                value[offset] = terrain
+        else:
+            value = super().materialize(name, index)
+        if name == "nearby_ants":
+            # Other ants move every step, so they are never reused
+            return value
+        if name != "visible_cells":
+            entry.stamps[name] = self._pheromone_stamp(name)
+        entry.values[name] = value
+        return value
+
+    def _pheromone_stamp(self, name: str) -> tuple:
+        ant, vision_range = self.ant, self.entry.stencil.vision_range
+        pheromones = pheromone_map(self.environment, name)
+        stamp = pheromones.get_version_stamp(int(ant.x), int(ant.y), vision_range)
+        return (pheromones, *stamp)
+
+
+def pheromone_map(environment, name: str):
+    """Get the environment's pheromone map behind a pheromone perception field"""
+    if name == "food_pheromone":
+        return environment.food_pheromones
+    return environment.home_pheromones
+
+
+class PerceptionCache:
+    """
+    Last perception of each ant, for Environment.get_perception_for_ant to
+    reuse while the ant stays on the same cell.
+
+    Nothing is reused once the terrain version stamp around the ant changes
+    (a wall, food running out, a colony) or the ant moves. After a pure turn
+    the visible cells are listed again for the new cone, but the terrain of
+    the offsets it shares with the old one is reused. When the cone is the
+    same, visible_cells is reused as is and each pheromone field is reused
+    while its map reports the same version stamp around the ant. nearby_ants
+    is always rebuilt. Reused fields are the same objects as in the previous
+    perception, so strategies must not modify them.
+
+    counts records how many perceptions were reused, turned or rebuilt.
+    """
+
+    def __init__(self):
+        self.entries = {}
+        self.counts = {"reused": 0, "turned": 0, "rebuilt": 0}
+
+    def get_source(
+        self, environment, ant, current_terrain, vision_range: int
+    ) -> CachedCellSource:
+        """Get the source of the ant's next perception, reusing what is valid"""
+        x, y = int(ant.x), int(ant.y)
+        stencil = get_vision_stencil(ant.direction, vision_range, ant.vision_angle)
+        terrain_stamp = environment.get_terrain_stamp(x, y, vision_range)
+        entry = self.entries.get(ant)
+
+        if (
+            entry is None
+            or entry.position != (x, y)
+            or entry.terrain_stamp != terrain_stamp
+        ):
+            self.counts["rebuilt"] += 1
+            cells = environment.get_visible_cells(ant, vision_range)
+            entry = self.entries[ant] = ConeEntry((x, y), stencil, terrain_stamp, cells)
+            return CachedCellSource(environment, ant, current_terrain, entry)
+
+        if entry.stencil is not stencil:
+            self.counts["turned"] += 1
+            known_terrain = entry.values.get("visible_cells")
+            cells = environment.get_visible_cells(ant, vision_range)
+            entry = self.entries[ant] = ConeEntry((x, y), stencil, terrain_stamp, cells)
+            return CachedCellSource(
+                environment, ant, current_terrain, entry, known_terrain
+            )
+
+        self.counts["reused"] += 1
+        for name, (pheromones, version, deposits) in list(entry.stamps.items()):
+            # The map-wide version is checked first, it changes on every evaporation
+            if (
+                pheromones is not pheromone_map(environment, name)
+                or pheromones.version != version
+                or pheromones.get_version_stamp(x, y, vision_range)[1] != deposits
+            ):
+                del entry.stamps[name]
+                del entry.values[name]
+        return CachedCellSource(environment, ant, current_terrain, entry)
+
+
+# AntPerception attributes describing the surroundings, built per perception
+PERCEPTION_FIELDS = ("visible_cells", "food_pheromone", "home_pheromone", "nearby_ants")
+
+# (fields, cone) declared by each strategy class, see get_strategy_needs
+_perception_needs: Dict[type, tuple] = {}
+
+
+def get_strategy_needs(strategy) -> tuple:
+    """
+    Get the PERCEPTION_FIELDS a strategy reads, in PERCEPTION_FIELDS order,
+    and whether it looks past the ant's own cell, from the perception_fields
+    and perception_cone attributes of its class. A missing strategy gets the
+    full perception.
+    """
+    strategy_class = type(strategy)
+    needs = _perception_needs.get(strategy_class)
+    if needs is None:
+        declared = getattr(strategy_class, "perception_fields", None)
+        if declared is None:
+            fields = PERCEPTION_FIELDS
+        else:
+            unknown = set(declared) - set(PERCEPTION_FIELDS)
+            if unknown:
+                raise ValueError(
+                    f"Unknown perception fields in {strategy_class.__name__}: "
+                    f"{', '.join(sorted(unknown))}"
+                )
+            fields = tuple(name for name in PERCEPTION_FIELDS if name in declared)
+        cone = bool(getattr(strategy_class, "perception_cone", True))
+        needs = _perception_needs[strategy_class] = (fields, cone)
+    return needs
+
+
+def empty_field(name: str):
+    """Value of a perception field that was not built, as in a new AntPerception"""
+    return [] if name == "nearby_ants" else {}
+
+
+def copy_ant_state(perception: AntPerception, ant) -> None:
+    """Copy the ant's own properties into a perception"""
+    perception.has_food = ant.has_food
+    perception.direction = ant.direction
+    perception.home_pheromone_level = ant.home_pheromone
+    perception.food_pheromone_level = ant.food_pheromone
+    perception.pheromone_decrease_rate = ant.pheromone_decrease_rate
+    perception.food_collected = ant.food_collected
+    perception.steps_taken = ant.steps_taken
+    perception.ant_id = ant.id
+
+
+class LazyAntPerception(AntPerception):
+    """
+    AntPerception that builds each of the PERCEPTION_FIELDS the first time it
+    is read, so strategies do not pay for fields they ignore.
+
+    source is a BatchPerception or VisibleCellSource. It is read when a field
+    is first used, so fields must be read during decide_action: batch buffers
+    are reused and the world changes on the next step. usage, when given,
+    counts how many fields of each name were built. Fields left out of fields
+    are empty and never built, and summaries are computed on first read too.
+    """
+
+    __slots__ = ("_source", "_index", "_usage")
+
+    def __init__(
+        self,
+        source,
+        index: int = 0,
+        usage: Optional[dict] = None,
+        fields: tuple = PERCEPTION_FIELDS,
+    ):
+        # AntPerception.__init__ is skipped, it would build every field up front
+        self._source = source
+        self._index = index
+        self._usage = usage
+        if fields is not PERCEPTION_FIELDS:
+            for name in PERCEPTION_FIELDS:
+                if name not in fields:
+                    setattr(self, name, empty_field(name))
+
+    def __getattr__(self, name: str):
+        # Only called for attributes that have not been set yet
+        if name not in PERCEPTION_FIELDS:
+            return super().__getattr__(name)
+        value = self._source.materialize(name, self._index)
+        setattr(self, name, value)
+        if self._usage is not None:
+            self._usage[name] += 1
+        return value
+
+
+# TerrainType members by value, for converting stored terrain codes
+TERRAIN_TYPES = {terrain.value: terrain for terrain in TerrainType}
+
+
+class CompactAntPerception(AntPerception):
+    """
+    AntPerception that stores the perceived cells in lists indexed by the
+    slots of the ant's vision stencil, instead of building dicts.
+
+    visible_cells, food_pheromone and home_pheromone are read-only mapping
+    views over those lists, iterating in the same order as the dicts they
+    replace, and nearby_ants is a list refilled in place. Objects are meant to
+    be pooled: every load_* call overwrites the previous contents, so a
+    perception must not be kept past the decide_action it was made for.
+    Fields left out of fields are empty.
+    """
+
+    __slots__ = (
+        "stencil",
+        "fields",
+        "current_terrain",
+        "visible_slots",
+        "terrain",
+        "food",
+        "home",
+        "_nearby_ants",
+        "_views",
+    )
+
+    def __init__(self):
+        # AntPerception.__init__ is skipped, the mappings are views here
+        self.stencil = None
+        self.fields = PERCEPTION_FIELDS
+        self.current_terrain = None
+        self.visible_slots = []
+        self.terrain = []
+        self.food = []
+        self.home = []
+        self._nearby_ants = []
+        self._views = (
+            VisibleCellsView(self),
+            PheromoneView(self, "food"),
+            PheromoneView(self, "home"),
+        )
+        self.has_food = False
+        self.direction = None
+        self.home_pheromone_level = None
+        self.food_pheromone_level = None
+        self.pheromone_decrease_rate = None
+        self.food_collected = 0
+        self.steps_taken = 0
+        self.ant_id = None
+
+    @property
+    def visible_cells(self) -> Mapping:
+        return self._views[0]
+
+    @property
+    def food_pheromone(self) -> Mapping:
+        return self._views[1]
+
+    @property
+    def home_pheromone(self) -> Mapping:
+        return self._views[2]
+
+    @property
+    def nearby_ants(self) -> list:
+        return self._nearby_ants
+
+    def _reset(self, stencil: VisionStencil) -> None:
+        if stencil is not self.stencil:
+            size = len(stencil.offsets)
+            self.stencil = stencil
+            self.terrain = [None] * size
+            self.food = [0.0] * size
+            self.home = [0.0] * size
+        else:
+            terrain = self.terrain
+            for slot in self.visible_slots:
+                terrain[slot] = None
+        self.visible_slots.clear()
+        self._nearby_ants.clear()
+        self.clear_summaries()
+
+    def load_cells(
+        self,
+        environment,
+        ant,
+        current_terrain,
+        cells: list,
+        fields: tuple = PERCEPTION_FIELDS,
+    ) -> None:
+        """Fill from the ((dx, dy), x, y) cells Environment.get_visible_cells lists"""
+        stencil = get_vision_stencil(ant.direction, ant.vision_range, ant.vision_angle)
+        self._reset(stencil)
+        self.fields = fields
+        self.current_terrain = current_terrain
+        copy_ant_state(self, ant)
+
+        slot_of = stencil.slot_of
+        visible_slots, terrain = self.visible_slots, self.terrain
+        grid = environment.grid
+        for offset, x, y in cells:
+            slot = slot_of[offset]
+            visible_slots.append(slot)
+            terrain[slot] = TERRAIN_TYPES[grid[y][x]]
+
+        if "food_pheromone" in fields:
+            get_food = environment.food_pheromones.get_value
+            food = self.food
+            for offset, x, y in cells:
+                food[slot_of[offset]] = get_food(x, y)
+        if "home_pheromone" in fields:
+            get_home = environment.home_pheromones.get_value
+            home = self.home
+            for offset, x, y in cells:
+                home[slot_of[offset]] = get_home(x, y)
+
+        if "nearby_ants" in fields:
+            for offset, x, y in cells:
+                other_ant = environment.get_ant_at(x, y, exclude=ant)
+                if other_ant is not None:
+                    self._nearby_ants.append((offset, other_ant.has_food))
+
+    def load_batch(self, batch: BatchPerception, index: int) -> None:
+        """Fill from the rows of ants[index] in a computed BatchPerception"""
+        group, row = batch.locations[index]
+        stencil = group.stencil
+        self._reset(stencil)
+        fields = self.fields = batch.fields[index]
+        current_terrain = int(batch.current_terrain[index])
+        self.current_terrain = TERRAIN_TYPES.get(current_terrain)
+        copy_ant_state(self, batch.ants[index])
+
+        columns = np.flatnonzero(group.visible[row]).tolist()
+        self.visible_slots.extend(columns)
+        codes = group.terrain[row].tolist()
+        terrain = self.terrain
+        for column in columns:
+            terrain[column] = TERRAIN_TYPES[codes[column]]
+        if "food_pheromone" in fields:
+            self.food = group.food[row].tolist()
+        if "home_pheromone" in fields:
+            self.home = group.home[row].tolist()
+        if "nearby_ants" not in fields:
+            return
+
+        offsets, has_food = stencil.offsets, batch.has_food
+        neighbor = group.neighbor[row].tolist()
+        for column in columns:
+            if neighbor[column] >= 0:
+                self._nearby_ants.append(
+                    (offsets[column], bool(has_food[neighbor[column]]))
+                )
+
+
+class SlotView(Mapping, ABC):
+    """
+    Read-only mapping from the visible offsets of a CompactAntPerception,
+    empty when its field is not in the perception's fields
+    """
+
+    __slots__ = ("_perception", "_field")
+
+    def __init__(self, perception: CompactAntPerception, field: str):
+        self._perception = perception
+        self._field = field
+
+    def _enabled(self) -> bool:
+        return self._field in self._perception.fields
+
+    def _slot(self, offset) -> int:
+        perception = self._perception
+        stencil = perception.stencil
+        slot = None
+        if stencil is not None and self._enabled():
+            slot = stencil.slot_of.get(offset)
+        if slot is None or perception.terrain[slot] is None:
+            raise KeyError(offset)
+        return slot
+
+    @abstractmethod
+    def _values(self) -> list:
+        """Values of every stencil slot, indexed like stencil.offsets"""
+        pass
+
+    def _items(self):
+        perception = self._perception
+        if perception.stencil is None or not self._enabled():
+            return
+        offsets, values = perception.stencil.offsets, self._values()
+        for slot in perception.visible_slots:
+            yield offsets[slot], values[slot]
+
+    def __getitem__(self, offset):
+        return self._values()[self._slot(offset)]
+
+    def __iter__(self):
+        for offset, _ in self._items():
+            yield offset
+
+    def __len__(self) -> int:
+        return len(self._perception.visible_slots) if self._enabled() else 0
+
+    def items(self) -> ItemsView:
+        return SlotItemsView(self)
+
+    def values(self) -> ValuesView:
+        return SlotValuesView(self)
+
+    def __repr__(self) -> str:
+        return repr(dict(self._items()))
+
+
+class VisibleCellsView(SlotView):
+    """visible_cells of a CompactAntPerception, with the ant's own cell first"""
+
+    __slots__ = ()
+
+    def __init__(self, perception: CompactAntPerception):
+        super().__init__(perception, "visible_cells")
+
+    def _values(self) -> list:
+        return self._perception.terrain
+
+    def _own_cell(self) -> bool:
+        return self._perception.current_terrain is not None and self._enabled()
+
+    def _items(self):
+        if self._own_cell():
+            yield (0, 0), self._perception.current_terrain
+        yield from super()._items()
+
+    def __getitem__(self, offset):
+        if offset == (0, 0) and self._own_cell():
+            return self._perception.current_terrain
+        return super().__getitem__(offset)
+
+    def __len__(self) -> int:
+        return super().__len__() + self._own_cell()
+
+
+class PheromoneView(SlotView):
+    """food_pheromone or home_pheromone of a CompactAntPerception"""
+
+    __slots__ = ("_layer",)
+
+    def __init__(self, perception: CompactAntPerception, layer: str):
+        super().__init__(perception, f"{layer}_pheromone")
+        self._layer = layer
+
+    def _values(self) -> list:
+        return getattr(self._perception, self._layer)
+
+
+class SlotItemsView(ItemsView):
+    __slots__ = ()
+
+    def __iter__(self):
+        return self._mapping._items()
+
+
+class SlotValuesView(ValuesView):
+    __slots__ = ()
+
+    def __iter__(self):
+        for _, value in self._mapping._items():
+            yield value
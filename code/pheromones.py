@@ -0,0 +1,1164 @@
+from typing import Iterator, Optional, Tuple, Union
+import heapq
+import math
+
+import numpy as np
+
+from common import Direction
+
+# Pheromone values that evaporate below this level are dropped
+EVAPORATION_CUTOFF = 0.01
+
+# Side of the square regions whose changes are counted for version stamps
+VERSION_REGION_SIZE = 16
+
+# Direction deltas indexed by Direction value, for vectorized ray probes
+DIRECTION_DX = np.array([Direction.get_delta(d)[0] for d in Direction])
+DIRECTION_DY = np.array([Direction.get_delta(d)[1] for d in Direction])
+
+
+# Class for pheromone handling
+class PheromoneMap:
+    # Coarser copies of the map for long-range queries, see enable_pyramid()
+    pyramid_levels = ()
+    # Whether drain_dirty() reports the cells evaporate() changed
+    reports_decay = True
+
+    def __init__(
+        self,
+        width: int,
+        height: int,
+        evaporation_rate: float = 0.999,
+        track_changes: bool = True,
+    ):
+        self.width = width
+        self.height = height
+        self.evaporation_rate = evaporation_rate
+        # Use a dictionary for sparse representation of pheromones
+        # Key is (x, y) tuple, value is pheromone strength
+        self.values = {}
+        # Record changed cells for drain_dirty(), off for headless runs
+        self.track_changes = track_changes
+        self._dirty = set()
+        # Change counters for get_version_stamp()
+        self.version = 0
+        self.region_versions = new_region_versions(width, height)
+
+    def add_pheromone(self, x: int, y: int, amount: float) -> None:
+        """Add pheromone at position (x, y)"""
+        if 0 <= x < self.width and 0 <= y < self.height:
+            pos = (x, y)
+            # Add maximum pheromone amount between current and new amount
+            self.values[pos] = max(self.values.get(pos, 0), amount)
+            self.region_versions[
+                y // VERSION_REGION_SIZE, x // VERSION_REGION_SIZE
+            ] += 1
+            if self.track_changes:
+                self._dirty.add(pos)
+            if self.pyramid_levels:
+                self._add_to_pyramid(x, y, amount)
+
+    def add_pheromones(
+        self, xs: np.ndarray, ys: np.ndarray, amounts: np.ndarray
+    ) -> None:
+        """
+        Add pheromone at many positions at once.
+
+        Same result as calling add_pheromone for each position in any order,
+        since every deposit keeps the maximum of the current and new amount.
+        """
+        add_pheromone = self.add_pheromone
+        for x, y, amount in zip(
+            np.asarray(xs).tolist(),
+            np.asarray(ys).tolist(),
+            np.asarray(amounts).tolist(),
+        ):
+            add_pheromone(x, y, amount)
+
+    def get_value(self, x: int, y: int) -> float:
+        """Get pheromone value at position (x, y)"""
+        if 0 <= x < self.width and 0 <= y < self.height:
+            return self.values.get((x, y), 0.0)
+        return 0.0
+
+    def get_values(self, xs, ys) -> np.ndarray:
+        """Get pheromone values at many (xs[i], ys[i]) positions, 0.0 outside the map"""
+        xs = np.asarray(xs, dtype=np.int64).ravel()
+        ys = np.asarray(ys, dtype=np.int64).ravel()
+        return self._gather(xs, ys)
+
+    def get_window(self, x: int, y: int, radius: int) -> np.ndarray:
+        """
+        Get the (2 * radius + 1) square of values centred on (x, y).
+
+        The result is indexed [dy + radius, dx + radius] and must be treated as
+        read-only, since dense maps return a view into their storage when the
+        window lies inside the map. Cells outside the map read as 0.0.
+        """
+        size = 2 * radius + 1
+        return self.get_region(x - radius, y - radius, size, size)
+
+    def get_region(self, left: int, top: int, width: int, height: int) -> np.ndarray:
+        """Get a (height, width) array of values, indexed [y - top, x - left]"""
+        ys, xs = np.mgrid[top : top + height, left : left + width]
+        inside = (xs >= 0) & (xs < self.width) & (ys >= 0) & (ys < self.height)
+        region = np.zeros((height, width), dtype=np.float64)
+        region[inside] = self._gather(xs[inside], ys[inside])
+        return region
+
+    def evaporate(self) -> None:
+        """Evaporate pheromones"""
+        self.version += 1
+        # Every live cell changes, including the ones about to be removed
+        if self.track_changes:
+            self._dirty.update(self.values)
+
+        # Create a list of positions to potentially remove
+        positions_to_remove = []
+
+        # Update all pheromone values
+        for pos, value in self.values.items():
+            # Apply evaporation
+            new_value = value * self.evaporation_rate
+
+            # If value is very small, mark for removal
+            if new_value < EVAPORATION_CUTOFF:
+                positions_to_remove.append(pos)
+            else:
+                self.values[pos] = new_value
+
+        # Remove very small values
+        for pos in positions_to_remove:
+            del self.values[pos]
+
+        for level_map in self.pyramid_levels:
+            level_map.evaporate()
+
+    def drain_dirty(self) -> set:
+        """
+        Return the (x, y) cells changed since the last drain and forget them.
+
+        Cells that evaporated to zero are included. Always empty when
+        track_changes is off.
+        """
+        dirty, self._dirty = self._dirty, set()
+        return dirty
+
+    def enable_pyramid(self) -> None:
+        """
+        Maintain a max pyramid for get_strongest_direction_within().
+
+        Level k holds, for each 2^k x 2^k block, the strongest value inside
+        it. Levels are maps of the same backend that receive the same
+        deposits and evaporate at the same rate. Max commutes with both
+        operations, so they stay exact without being rebuilt.
+        """
+        levels = []
+        width, height = self.width, self.height
+        while width > 1 or height > 1:
+            width, height = (width + 1) // 2, (height + 1) // 2
+            levels.append(
+                type(self)(width, height, self.evaporation_rate, track_changes=False)
+            )
+        self.pyramid_levels = levels
+        for x, y, value in self._live_cells():
+            self._add_to_pyramid(x, y, value)
+
+    def _add_to_pyramid(self, x: int, y: int, amount: float) -> None:
+        for level, level_map in enumerate(self.pyramid_levels, 1):
+            level_map.add_pheromone(x >> level, y >> level, amount)
+
+    def _add_many_to_pyramid(
+        self, xs: np.ndarray, ys: np.ndarray, amounts: np.ndarray
+    ) -> None:
+        for level, level_map in enumerate(self.pyramid_levels, 1):
+            level_map.add_pheromones(xs >> level, ys >> level, amounts)
+
+    def _inside(
+        self, xs: np.ndarray, ys: np.ndarray, amounts: np.ndarray
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Convert bulk deposits to arrays and drop the ones outside the map"""
+        xs = np.asarray(xs, dtype=np.int64)
+        ys = np.asarray(ys, dtype=np.int64)
+        amounts = np.asarray(amounts, dtype=np.float64)
+        inside = (xs >= 0) & (xs < self.width) & (ys >= 0) & (ys < self.height)
+        if not inside.all():
+            xs, ys, amounts = xs[inside], ys[inside], amounts[inside]
+        return xs, ys, amounts
+
+    def _count_deposits(self, xs: np.ndarray, ys: np.ndarray) -> None:
+        """Bump the region versions for deposits at positions inside the map"""
+        size = VERSION_REGION_SIZE
+        np.add.at(self.region_versions, (ys // size, xs // size), 1)
+
+    def get_version_stamp(self, x: int, y: int, radius: int) -> tuple:
+        """
+        Get a stamp of the values within radius of (x, y). It differs from an
+        earlier stamp of the same square whenever one of those values may have
+        changed in between: version counts changes to the whole map, such as
+        evaporation and diffusion, and region_versions the deposits per region.
+        """
+        return self.version, region_stamp(self.region_versions, x, y, radius)
+
+    def get_strongest_direction_within(
+        self, x: int, y: int, radius: int
+    ) -> Optional[Direction]:
+        """
+        Get the direction towards the strongest cell within radius of (x, y).
+
+        The search covers the square of half-width radius around (x, y),
+        excluding (x, y) itself. It starts from a handful of pyramid blocks
+        covering the square and descends best-first, only opening blocks
+        whose maximum can still beat the best cell found, which takes
+        roughly logarithmic time in the radius. Without a pyramid it
+        scans the square cell by cell.
+        """
+        min_x, max_x = x - radius, x + radius
+        min_y, max_y = y - radius, y + radius
+        maps = [self, *self.pyramid_levels]
+        start_level = min(
+            len(self.pyramid_levels), max(0, (2 * radius + 1).bit_length() - 3)
+        )
+
+        heap = []
+        order = 0
+        level = start_level
+        for block_y in range(min_y >> level, (max_y >> level) + 1):
+            for block_x in range(min_x >> level, (max_x >> level) + 1):
+                value = maps[level].get_value(block_x, block_y)
+                if value > 0.0:
+                    heapq.heappush(heap, (-value, order, level, block_x, block_y))
+                    order += 1
+
+        while heap:
+            _, _, level, block_x, block_y = heapq.heappop(heap)
+            if level == 0:
+                if (block_x, block_y) != (x, y):
+                    return direction_towards(block_x - x, block_y - y)
+                continue
+            # Open the children of the block that overlap the square
+            level -= 1
+            for child_y in (2 * block_y, 2 * block_y + 1):
+                if not (min_y >> level) <= child_y <= (max_y >> level):
+                    continue
+                for child_x in (2 * block_x, 2 * block_x + 1):
+                    if not (min_x >> level) <= child_x <= (max_x >> level):
+                        continue
+                    value = maps[level].get_value(child_x, child_y)
+                    if value > 0.0:
+                        heapq.heappush(heap, (-value, order, level, child_x, child_y))
+                        order += 1
+        return None
+
+    def _live_cells(self) -> Iterator[Tuple[int, int, float]]:
+        """Iterate over (x, y, value) for every cell holding pheromone"""
+        for (x, y), value in self.values.items():
+            yield x, y, value
+
+    def diffuse(self, rate: float, open_cells: np.ndarray) -> None:
+        """
+        Spread pheromone to the four neighbouring cells.
+
+        open_cells is a (height, width) boolean array of cells pheromone may
+        occupy; no pheromone flows into or out of the other cells. Sparse
+        backends convert the whole map to an array and back, so diffusion is
+        best paired with the dense or quantized backends.
+        """
+        values = self.to_array()
+        diffuse_array(values, rate, open_cells)
+        self._load_array(values)
+        if self.pyramid_levels:
+            # Diffusion does not commute with max, so rebuild from scratch
+            self.enable_pyramid()
+
+    def to_array(self) -> np.ndarray:
+        """Get pheromone values as a (height, width) array indexed [y, x]"""
+        values = np.zeros((self.height, self.width), dtype=np.float64)
+        for x, y, value in self._live_cells():
+            values[y, x] = value
+        return values
+
+    def _load_array(self, values: np.ndarray) -> None:
+        """Replace all pheromone values with the contents of a full-map array"""
+        self.version += 1
+        if self.track_changes:
+            self._dirty.update(self.values)
+        ys, xs = np.nonzero(values)
+        self.values = dict(zip(zip(xs.tolist(), ys.tolist()), values[ys, xs].tolist()))
+        if self.track_changes:
+            self._dirty.update(self.values)
+
+    def set_rows(self, top: int, values: np.ndarray) -> None:
+        """
+        Overwrite rows top .. top + len(values) - 1 with a (rows, width) array,
+        such as the rows a neighbouring part of the world holds
+        """
+        self.version += 1
+        bottom = top + len(values)
+        stale = [pos for pos in self.values if top <= pos[1] < bottom]
+        for pos in stale:
+            del self.values[pos]
+        ys, xs = np.nonzero(values)
+        cells = dict(
+            zip(zip(xs.tolist(), (ys + top).tolist()), values[ys, xs].tolist())
+        )
+        self.values.update(cells)
+        if self.track_changes:
+            self._dirty.update(stale, cells)
+        if self.pyramid_levels:
+            self.enable_pyramid()
+
+    def get_strongest_direction(
+        self, x: int, y: int, vision_range: int = 3
+    ) -> Optional[Direction]:
+        """Get direction with highest pheromone concentration"""
+        max_value = 0.0
+        best_direction = None
+
+        for direction in Direction:
+            dx, dy = Direction.get_delta(direction)
+            value_sum = 0.0
+
+            for strength in range(1, vision_range + 1):
+                check_x, check_y = x + dx * strength, y + dy * strength
+                if 0 <= check_x < self.width and 0 <= check_y < self.height:
+                    value_sum += (
+                        self.get_value(int(check_x), int(check_y)) / strength
+                    )  # Closer is stronger
+
+            if value_sum > max_value:
+                max_value = value_sum
+                best_direction = direction
+
+        return best_direction
+
+    def get_strongest_directions(
+        self,
+        xs: np.ndarray,
+        ys: np.ndarray,
+        vision_ranges: Union[int, np.ndarray] = 3,
+    ) -> np.ndarray:
+        """
+        Batched get_strongest_direction for many positions at once.
+
+        Returns an array with the Direction value of the strongest ray for
+        each (xs[i], ys[i]), or -1 where no ray holds any pheromone. Results
+        match calling get_strongest_direction once per position.
+        """
+        xs = np.asarray(xs, dtype=np.int64)
+        ys = np.asarray(ys, dtype=np.int64)
+        vision_ranges = np.broadcast_to(np.asarray(vision_ranges), xs.shape)
+        max_range = int(vision_ranges.max()) if xs.size else 0
+
+        # Probe every ray cell of every position with one gather: shape (n, 8, range)
+        strengths = np.arange(1, max_range + 1)
+        probe_x = xs[:, None, None] + DIRECTION_DX[None, :, None] * strengths
+        probe_y = ys[:, None, None] + DIRECTION_DY[None, :, None] * strengths
+        probes = self._gather(probe_x.ravel(), probe_y.ravel()).reshape(probe_x.shape)
+
+        # Accumulate one strength at a time to keep the scalar summation order
+        sums = np.zeros((xs.size, len(DIRECTION_DX)))
+        for strength in range(1, max_range + 1):
+            in_range = (vision_ranges >= strength)[:, None]
+            sums += np.where(in_range, probes[:, :, strength - 1] / strength, 0.0)
+
+        best = np.argmax(sums, axis=1)
+        best[sums[np.arange(xs.size), best] <= 0.0] = -1
+        return best
+
+    def _gather(self, xs: np.ndarray, ys: np.ndarray) -> np.ndarray:
+        """Get pheromone values at many positions, 0.0 outside the map"""
+        get = self.values.get
+        return np.fromiter(
+            (get(pos, 0.0) for pos in zip(xs.tolist(), ys.tolist())),
+            dtype=np.float64,
+            count=len(xs),
+        )
+
+
+class DensePheromoneMap(PheromoneMap):
+    """
+    Pheromone map backed by a dense NumPy array.
+
+    Evaporation is a single in-place multiply followed by a masked reset of
+    the values that fell below the cutoff, so its cost no longer depends on
+    the Python overhead of walking every live cell. Values are stored as
+    float64, which keeps the results identical to the dictionary backend.
+    """
+
+    def __init__(
+        self,
+        width: int,
+        height: int,
+        evaporation_rate: float = 0.999,
+        track_changes: bool = True,
+    ):
+        self.width = width
+        self.height = height
+        self.evaporation_rate = evaporation_rate
+        # Indexed as grid[y, x] to match Environment.grid
+        self.grid = np.zeros((height, width), dtype=np.float64)
+        self._below_cutoff = np.zeros((height, width), dtype=bool)
+        self.track_changes = track_changes
+        self._dirty_mask = np.zeros((height, width), dtype=bool)
+        self.version = 0
+        self.region_versions = new_region_versions(width, height)
+
+    def add_pheromone(self, x: int, y: int, amount: float) -> None:
+        """Add pheromone at position (x, y)"""
+        if 0 <= x < self.width and 0 <= y < self.height:
+            if amount > self.grid[y, x]:
+                self.grid[y, x] = amount
+            self.region_versions[
+                y // VERSION_REGION_SIZE, x // VERSION_REGION_SIZE
+            ] += 1
+            if self.track_changes:
+                self._dirty_mask[y, x] = True
+            if self.pyramid_levels:
+                self._add_to_pyramid(x, y, amount)
+
+    def add_pheromones(
+        self, xs: np.ndarray, ys: np.ndarray, amounts: np.ndarray
+    ) -> None:
+        """Add pheromone at many positions at once with one scatter-max"""
+        xs, ys, amounts = self._inside(xs, ys, amounts)
+        np.maximum.at(self.grid, (ys, xs), amounts)
+        self._count_deposits(xs, ys)
+        if self.track_changes:
+            self._dirty_mask[ys, xs] = True
+        if self.pyramid_levels:
+            self._add_many_to_pyramid(xs, ys, amounts)
+
+    def get_value(self, x: int, y: int) -> float:
+        """Get pheromone value at position (x, y)"""
+        if 0 <= x < self.width and 0 <= y < self.height:
+            return float(self.grid[y, x])
+        return 0.0
+
+    def get_region(self, left: int, top: int, width: int, height: int) -> np.ndarray:
+        """Get a (height, width) array of values, indexed [y - top, x - left]"""
+        return read_region(self.grid, left, top, width, height, 0.0)
+
+    def evaporate(self) -> None:
+        """Evaporate pheromones"""
+        self.version += 1
+        if self.track_changes:
+            self._dirty_mask |= self.grid > 0.0
+        np.multiply(self.grid, self.evaporation_rate, out=self.grid)
+        np.less(self.grid, EVAPORATION_CUTOFF, out=self._below_cutoff)
+        np.putmask(self.grid, self._below_cutoff, 0.0)
+        for level_map in self.pyramid_levels:
+            level_map.evaporate()
+
+    def drain_dirty(self) -> set:
+        """Return the (x, y) cells changed since the last drain and forget them"""
+        ys, xs = np.nonzero(self._dirty_mask)
+        self._dirty_mask[ys, xs] = False
+        return set(zip(xs.tolist(), ys.tolist()))
+
+    def _live_cells(self) -> Iterator[Tuple[int, int, float]]:
+        """Iterate over (x, y, value) for every cell holding pheromone"""
+        ys, xs = np.nonzero(self.grid)
+        return zip(xs.tolist(), ys.tolist(), self.grid[ys, xs].tolist())
+
+    def diffuse(self, rate: float, open_cells: np.ndarray) -> None:
+        """Spread pheromone to the four neighbouring cells, in place"""
+        if self.track_changes:
+            before = self.grid.copy()
+        diffuse_array(self.grid, rate, open_cells)
+        self.version += 1
+        if self.track_changes:
+            self._dirty_mask |= before != self.grid
+        if self.pyramid_levels:
+            self.enable_pyramid()
+
+    def to_array(self) -> np.ndarray:
+        """Get pheromone values as a (height, width) array indexed [y, x]"""
+        return self.grid.copy()
+
+    def _load_array(self, values: np.ndarray) -> None:
+        """Replace all pheromone values with the contents of a full-map array"""
+        self.version += 1
+        if self.track_changes:
+            self._dirty_mask |= self.grid != values
+        self.grid[...] = values
+
+    def set_rows(self, top: int, values: np.ndarray) -> None:
+        """Overwrite rows top .. top + len(values) - 1 with a (rows, width) array"""
+        rows = self.grid[top : top + len(values)]
+        self.version += 1
+        if self.track_changes:
+            self._dirty_mask[top : top + len(values)] |= rows != values
+        rows[...] = values
+        if self.pyramid_levels:
+            self.enable_pyramid()
+
+    def _gather(self, xs: np.ndarray, ys: np.ndarray) -> np.ndarray:
+        """Get pheromone values at many positions, 0.0 outside the map"""
+        values = np.zeros(len(xs), dtype=np.float64)
+        inside = (xs >= 0) & (xs < self.width) & (ys >= 0) & (ys < self.height)
+        values[inside] = self.grid[ys[inside], xs[inside]]
+        return values
+
+
+class LazyPheromoneMap(PheromoneMap):
+    """
+    Pheromone map that evaporates lazily.
+
+    Every cell decays by the same rate each step, so instead of rewriting all
+    values in evaporate() each cell keeps the value it was written with and
+    the epoch of that write. Reads scale the stored value by
+    evaporation_rate ** (epoch - stamp), which makes evaporate() a counter
+    increment. Cells that decayed below the cutoff read as zero and are
+    dropped by a compaction sweep every compaction_interval steps.
+
+    Values can differ from the dictionary backend in the last bits, since a
+    power replaces the repeated multiplication. Change tracking reports
+    deposits and cells dropped by compaction, but not the implicit decay
+    every live cell goes through on each step.
+    """
+
+    reports_decay = False
+
+    def __init__(
+        self,
+        width: int,
+        height: int,
+        evaporation_rate: float = 0.999,
+        track_changes: bool = True,
+        compaction_interval: int = 256,
+    ):
+        self.width = width
+        self.height = height
+        self.evaporation_rate = evaporation_rate
+        self.compaction_interval = compaction_interval
+        # Key is (x, y) tuple, value is (strength when written, epoch of the write)
+        self.cells = {}
+        self.epoch = 0
+        self.track_changes = track_changes
+        self._dirty = set()
+        self.version = 0
+        self.region_versions = new_region_versions(width, height)
+
+    def _decayed(self, value: float, stamp: int) -> float:
+        if stamp != self.epoch:
+            value *= self.evaporation_rate ** (self.epoch - stamp)
+            if value < EVAPORATION_CUTOFF:
+                return 0.0
+        return value
+
+    def add_pheromone(self, x: int, y: int, amount: float) -> None:
+        """Add pheromone at position (x, y)"""
+        if 0 <= x < self.width and 0 <= y < self.height:
+            pos = (x, y)
+            entry = self.cells.get(pos)
+            current = self._decayed(*entry) if entry is not None else 0
+            self.cells[pos] = (max(current, amount), self.epoch)
+            self.region_versions[
+                y // VERSION_REGION_SIZE, x // VERSION_REGION_SIZE
+            ] += 1
+            if self.track_changes:
+                self._dirty.add(pos)
+            if self.pyramid_levels:
+                self._add_to_pyramid(x, y, amount)
+
+    def get_value(self, x: int, y: int) -> float:
+        """Get pheromone value at position (x, y)"""
+        if 0 <= x < self.width and 0 <= y < self.height:
+            entry = self.cells.get((x, y))
+            if entry is not None:
+                return self._decayed(*entry)
+        return 0.0
+
+    def evaporate(self) -> None:
+        """Evaporate pheromones"""
+        self.version += 1
+        self.epoch += 1
+        if self.epoch % self.compaction_interval == 0:
+            self.compact()
+        for level_map in self.pyramid_levels:
+            level_map.evaporate()
+
+    def _gather(self, xs: np.ndarray, ys: np.ndarray) -> np.ndarray:
+        """Get pheromone values at many positions, 0.0 outside the map"""
+        get_value = self.get_value
+        return np.fromiter(
+            (get_value(x, y) for x, y in zip(xs.tolist(), ys.tolist())),
+            dtype=np.float64,
+            count=len(xs),
+        )
+
+    def _live_cells(self) -> Iterator[Tuple[int, int, float]]:
+        """Iterate over (x, y, value) for every cell holding pheromone"""
+        for (x, y), entry in self.cells.items():
+            value = self._decayed(*entry)
+            if value > 0.0:
+                yield x, y, value
+
+    def _load_array(self, values: np.ndarray) -> None:
+        """Replace all pheromone values with the contents of a full-map array"""
+        self.version += 1
+        ys, xs = np.nonzero(values)
+        cells = {
+            pos: (value, self.epoch)
+            for pos, value in zip(
+                zip(xs.tolist(), ys.tolist()), values[ys, xs].tolist()
+            )
+        }
+        if self.track_changes:
+            self._dirty.update(self.cells, cells)
+        self.cells = cells
+
+    def set_rows(self, top: int, values: np.ndarray) -> None:
+        """Overwrite rows top .. top + len(values) - 1 with a (rows, width) array"""
+        self.version += 1
+        bottom = top + len(values)
+        stale = [pos for pos in self.cells if top <= pos[1] < bottom]
+        for pos in stale:
+            del self.cells[pos]
+        ys, xs = np.nonzero(values)
+        cells = {
+            pos: (value, self.epoch)
+            for pos, value in zip(
+                zip(xs.tolist(), (ys + top).tolist()), values[ys, xs].tolist()
+            )
+        }
+        self.cells.update(cells)
+        if self.track_changes:
+            self._dirty.update(stale, cells)
+        if self.pyramid_levels:
+            self.enable_pyramid()
+
+    def compact(self) -> None:
+        """Drop cells that have decayed below the cutoff"""
+        live_cells = {
+            pos: entry
+            for pos, entry in self.cells.items()
+            if self._decayed(*entry) > 0.0
+        }
+        if self.track_changes and len(live_cells) != len(self.cells):
+            self._dirty.update(self.cells.keys() - live_cells.keys())
+        self.cells = live_cells
+
+
+class TiledPheromoneMap(PheromoneMap):
+    """
+    Pheromone map stored as fixed-size square tiles allocated on demand.
+
+    A tile is created on the first deposit inside it and freed once all of
+    its values evaporated below the cutoff, so memory and evaporation cost
+    follow the area covered by trails rather than the size of the world.
+    The tiles dictionary doubles as the active-tile set. Values match the
+    dictionary backend.
+    """
+
+    def __init__(
+        self,
+        width: int,
+        height: int,
+        evaporation_rate: float = 0.999,
+        track_changes: bool = True,
+        tile_size: int = 64,
+    ):
+        self.width = width
+        self.height = height
+        self.evaporation_rate = evaporation_rate
+        self.tile_size = tile_size
+        # Key is (tile_x, tile_y), value is a tile_size x tile_size array indexed [y, x]
+        self.tiles = {}
+        self._below_cutoff = np.zeros((tile_size, tile_size), dtype=bool)
+        # Changed cells per tile, kept after a tile is freed until drained
+        self.track_changes = track_changes
+        self._dirty_tiles = {}
+        self.version = 0
+        self.region_versions = new_region_versions(width, height)
+
+    def _dirty_mask(self, key: tuple) -> np.ndarray:
+        mask = self._dirty_tiles.get(key)
+        if mask is None:
+            size = self.tile_size
+            mask = self._dirty_tiles[key] = np.zeros((size, size), dtype=bool)
+        return mask
+
+    def add_pheromone(self, x: int, y: int, amount: float) -> None:
+        """Add pheromone at position (x, y)"""
+        if 0 <= x < self.width and 0 <= y < self.height:
+            size = self.tile_size
+            key = (x // size, y // size)
+            tile = self.tiles.get(key)
+            if tile is None:
+                if not amount > 0:
+                    return
+                tile = self.tiles[key] = np.zeros((size, size), dtype=np.float64)
+            if amount > tile[y % size, x % size]:
+                tile[y % size, x % size] = amount
+            self.region_versions[
+                y // VERSION_REGION_SIZE, x // VERSION_REGION_SIZE
+            ] += 1
+            if self.track_changes:
+                self._dirty_mask(key)[y % size, x % size] = True
+            if self.pyramid_levels:
+                self._add_to_pyramid(x, y, amount)
+
+    def add_pheromones(
+        self, xs: np.ndarray, ys: np.ndarray, amounts: np.ndarray
+    ) -> None:
+        """Add pheromone at many positions at once, one scatter-max per tile"""
+        xs, ys, amounts = self._inside(xs, ys, amounts)
+        size = self.tile_size
+        tile_x, tile_y = xs // size, ys // size
+        tile_ids = tile_y * (self.width // size + 1) + tile_x
+        for tile_id in np.unique(tile_ids).tolist():
+            hits = tile_ids == tile_id
+            if not (amounts[hits] > 0).any():
+                continue
+            key = (int(tile_x[hits][0]), int(tile_y[hits][0]))
+            tile = self.tiles.get(key)
+            if tile is None:
+                tile = self.tiles[key] = np.zeros((size, size), dtype=np.float64)
+            local = (ys[hits] % size, xs[hits] % size)
+            np.maximum.at(tile, local, amounts[hits])
+            if self.track_changes:
+                self._dirty_mask(key)[local] = True
+        self._count_deposits(xs, ys)
+        if self.pyramid_levels:
+            self._add_many_to_pyramid(xs, ys, amounts)
+
+    def get_value(self, x: int, y: int) -> float:
+        """Get pheromone value at position (x, y)"""
+        if 0 <= x < self.width and 0 <= y < self.height:
+            size = self.tile_size
+            tile = self.tiles.get((x // size, y // size))
+            if tile is not None:
+                return float(tile[y % size, x % size])
+        return 0.0
+
+    def evaporate(self) -> None:
+        """Evaporate pheromones"""
+        self.version += 1
+        empty_tiles = []
+        for key, tile in self.tiles.items():
+            if self.track_changes:
+                self._dirty_mask(key)[tile > 0.0] = True
+            np.multiply(tile, self.evaporation_rate, out=tile)
+            np.less(tile, EVAPORATION_CUTOFF, out=self._below_cutoff)
+            np.putmask(tile, self._below_cutoff, 0.0)
+            if self._below_cutoff.all():
+                empty_tiles.append(key)
+
+        # Free tiles without any pheromone left
+        for key in empty_tiles:
+            del self.tiles[key]
+
+        for level_map in self.pyramid_levels:
+            level_map.evaporate()
+
+    def drain_dirty(self) -> set:
+        """Return the (x, y) cells changed since the last drain and forget them"""
+        dirty = set()
+        size = self.tile_size
+        for (tile_x, tile_y), mask in self._dirty_tiles.items():
+            ys, xs = np.nonzero(mask)
+            dirty.update(
+                zip((xs + tile_x * size).tolist(), (ys + tile_y * size).tolist())
+            )
+        self._dirty_tiles = {}
+        return dirty
+
+    def _load_array(self, values: np.ndarray) -> None:
+        """Replace all pheromone values with the contents of a full-map array"""
+        self.version += 1
+        size = self.tile_size
+        tiles = {}
+        for top in range(0, self.height, size):
+            for left in range(0, self.width, size):
+                key = (left // size, top // size)
+                block = values[top : top + size, left : left + size]
+                old_tile = self.tiles.get(key)
+                if old_tile is None and not block.any():
+                    continue
+                tile = np.zeros((size, size), dtype=np.float64)
+                tile[: block.shape[0], : block.shape[1]] = block
+                if self.track_changes and old_tile is not None:
+                    self._dirty_mask(key)[old_tile != tile] = True
+                elif self.track_changes:
+                    self._dirty_mask(key)[tile > 0.0] = True
+                if tile.any():
+                    tiles[key] = tile
+        self.tiles = tiles
+
+    def set_rows(self, top: int, values: np.ndarray) -> None:
+        """Overwrite rows top .. top + len(values) - 1 with a (rows, width) array"""
+        self.version += 1
+        size = self.tile_size
+        bottom = top + len(values)
+        for tile_y in range(top // size, (bottom - 1) // size + 1):
+            # The rows of this tile row being overwritten, in map coordinates
+            first, last = max(top, tile_y * size), min(bottom, (tile_y + 1) * size)
+            rows = slice(first - tile_y * size, last - tile_y * size)
+            for left in range(0, self.width, size):
+                key = (left // size, tile_y)
+                block = values[first - top : last - top, left : left + size]
+                tile = self.tiles.get(key)
+                if tile is None:
+                    if not block.any():
+                        continue
+                    tile = self.tiles[key] = np.zeros((size, size), dtype=np.float64)
+                cells = (rows, slice(0, block.shape[1]))
+                if self.track_changes:
+                    self._dirty_mask(key)[cells] |= tile[cells] != block
+                tile[cells] = block
+                if not tile.any():
+                    del self.tiles[key]
+        if self.pyramid_levels:
+            self.enable_pyramid()
+
+    def _live_cells(self) -> Iterator[Tuple[int, int, float]]:
+        """Iterate over (x, y, value) for every cell holding pheromone"""
+        size = self.tile_size
+        for (tile_x, tile_y), tile in self.tiles.items():
+            ys, xs = np.nonzero(tile)
+            yield from zip(
+                (xs + tile_x * size).tolist(),
+                (ys + tile_y * size).tolist(),
+                tile[ys, xs].tolist(),
+            )
+
+    def _gather(self, xs: np.ndarray, ys: np.ndarray) -> np.ndarray:
+        """Get pheromone values at many positions, 0.0 outside the map"""
+        size = self.tile_size
+        values = np.zeros(len(xs), dtype=np.float64)
+        inside = (xs >= 0) & (xs < self.width) & (ys >= 0) & (ys < self.height)
+        xs, ys = xs[inside], ys[inside]
+        positions = np.flatnonzero(inside)
+
+        # One fancy-indexed read per allocated tile touched by the positions
+        tile_x, tile_y = xs // size, ys // size
+        tile_ids = tile_y * (self.width // size + 1) + tile_x
+        for tile_id in np.unique(tile_ids).tolist():
+            hits = tile_ids == tile_id
+            key = (int(tile_x[hits][0]), int(tile_y[hits][0]))
+            tile = self.tiles.get(key)
+            if tile is not None:
+                values[positions[hits]] = tile[ys[hits] % size, xs[hits] % size]
+        return values
+
+
+class QuantizedPheromoneMap(PheromoneMap):
+    """
+    Pheromone map storing log-encoded values in a dense uint16 array.
+
+    Code 0 means no pheromone and code c >= 1 stands for
+    EVAPORATION_CUTOFF * exp((c - 1) * resolution), covering the range up
+    to max_value. The resolution is picked so that one evaporation step is
+    a whole number of codes whenever 16 bits allow it. Evaporation is then
+    an integer subtraction that adds no error of its own, and values stay
+    within max_relative_error of the float backends. Values are rounded
+    down to a code, so a cell also runs out at the same step as it does in
+    the float backends (see exact_lifetimes). For rates too close to 1 for
+    that, the fractional part of the per-step decay is carried over between
+    steps, which adds up to one code of extra error, and a cell can outlast
+    the float backends by a few steps.
+
+    Deposits below the cutoff are not stored, since every other backend
+    drops them on the next evaporation. Deposits above max_value are
+    clamped to it.
+    """
+
+    MAX_CODE = np.iinfo(np.uint16).max
+    # Slack in codes when rounding down, so decoded values encode to their code
+    ENCODING_SLACK = 1e-6
+
+    def __init__(
+        self,
+        width: int,
+        height: int,
+        evaporation_rate: float = 0.999,
+        track_changes: bool = True,
+        max_value: float = 100.0,
+    ):
+        self.width = width
+        self.height = height
+        self.evaporation_rate = evaporation_rate
+        self.max_value = max_value
+        # Indexed as codes[y, x] to match Environment.grid
+        self.codes = np.zeros((height, width), dtype=np.uint16)
+        self.track_changes = track_changes
+        self._dirty_mask = np.zeros((height, width), dtype=bool)
+        self.version = 0
+        self.region_versions = new_region_versions(width, height)
+
+        # Pick the log-space step so one evaporation is a whole number of codes
+        span = math.log(max_value / EVAPORATION_CUTOFF)
+        finest = span / (self.MAX_CODE - 1)
+        decay = -math.log(evaporation_rate) if evaporation_rate < 1.0 else 0.0
+        if decay >= finest:
+            self._codes_per_step = math.floor(decay / finest)
+            self.resolution = decay / self._codes_per_step
+        else:
+            self.resolution = finest
+            self._codes_per_step = decay / self.resolution
+        self._pending_decay = 0.0
+        self._decode = EVAPORATION_CUTOFF * np.exp(
+            np.arange(-1, self.MAX_CODE, dtype=np.float64) * self.resolution
+        )
+        self._decode[0] = 0.0
+
+    @property
+    def max_relative_error(self) -> float:
+        """Upper bound on the relative error against the float backends"""
+        error = math.expm1(self.resolution)
+        if not self.exact_lifetimes:
+            error += math.expm1(self.resolution)
+        return error
+
+    @property
+    def exact_lifetimes(self) -> bool:
+        """
+        Whether one evaporation step is a whole number of codes, so that every
+        cell runs out at the same step as in the float backends
+        """
+        return not self._codes_per_step % 1
+
+    def _encode(self, amount: float) -> int:
+        if not amount >= EVAPORATION_CUTOFF:
+            return 0
+        code = math.log(amount / EVAPORATION_CUTOFF) / self.resolution
+        code = math.floor(code + self.ENCODING_SLACK) + 1
+        return min(code, self.MAX_CODE)
+
+    def to_array(self) -> np.ndarray:
+        """Get pheromone values as a (height, width) array indexed [y, x]"""
+        return self._decode[self.codes]
+
+    def _encode_array(self, values: np.ndarray) -> np.ndarray:
+        stored = values >= EVAPORATION_CUTOFF
+        codes = np.zeros(values.shape, dtype=np.uint16)
+        codes[stored] = np.minimum(
+            np.floor(
+                np.log(values[stored] / EVAPORATION_CUTOFF) / self.resolution
+                + self.ENCODING_SLACK
+            )
+            + 1,
+            self.MAX_CODE,
+        )
+        return codes
+
+    def _load_array(self, values: np.ndarray) -> None:
+        """Replace all pheromone values with the contents of a full-map array"""
+        self.version += 1
+        codes = self._encode_array(values)
+        if self.track_changes:
+            self._dirty_mask |= self.codes != codes
+        self.codes = codes
+
+    def set_rows(self, top: int, values: np.ndarray) -> None:
+        """Overwrite rows top .. top + len(values) - 1 with a (rows, width) array"""
+        self.version += 1
+        codes = self._encode_array(values)
+        rows = slice(top, top + len(values))
+        if self.track_changes:
+            self._dirty_mask[rows] |= self.codes[rows] != codes
+        self.codes[rows] = codes
+        if self.pyramid_levels:
+            self.enable_pyramid()
+
+    def add_pheromone(self, x: int, y: int, amount: float) -> None:
+        """Add pheromone at position (x, y)"""
+        if 0 <= x < self.width and 0 <= y < self.height:
+            code = self._encode(amount)
+            if code > self.codes[y, x]:
+                self.codes[y, x] = code
+            self.region_versions[
+                y // VERSION_REGION_SIZE, x // VERSION_REGION_SIZE
+            ] += 1
+            if self.track_changes:
+                self._dirty_mask[y, x] = True
+            if self.pyramid_levels:
+                self._add_to_pyramid(x, y, amount)
+
+    def add_pheromones(
+        self, xs: np.ndarray, ys: np.ndarray, amounts: np.ndarray
+    ) -> None:
+        """Add pheromone at many positions at once with one scatter-max"""
+        xs, ys, amounts = self._inside(xs, ys, amounts)
+        np.maximum.at(self.codes, (ys, xs), self._encode_array(amounts))
+        self._count_deposits(xs, ys)
+        if self.track_changes:
+            self._dirty_mask[ys, xs] = True
+        if self.pyramid_levels:
+            self._add_many_to_pyramid(xs, ys, amounts)
+
+    def get_value(self, x: int, y: int) -> float:
+        """Get pheromone value at position (x, y)"""
+        if 0 <= x < self.width and 0 <= y < self.height:
+            return float(self._decode[self.codes[y, x]])
+        return 0.0
+
+    def get_region(self, left: int, top: int, width: int, height: int) -> np.ndarray:
+        """Get a (height, width) array of values, indexed [y - top, x - left]"""
+        return self._decode[read_region(self.codes, left, top, width, height, 0)]
+
+    def evaporate(self) -> None:
+        """Evaporate pheromones"""
+        self.version += 1
+        self._pending_decay += self._codes_per_step
+        step = int(self._pending_decay)
+        self._pending_decay -= step
+        if step:
+            if self.track_changes:
+                self._dirty_mask |= self.codes > 0
+            # Codes that would drop below 1 fall under the cutoff and become 0
+            np.putmask(self.codes, self.codes <= step, step)
+            self.codes -= step
+        for level_map in self.pyramid_levels:
+            level_map.evaporate()
+
+    def drain_dirty(self) -> set:
+        """Return the (x, y) cells changed since the last drain and forget them"""
+        ys, xs = np.nonzero(self._dirty_mask)
+        self._dirty_mask[ys, xs] = False
+        return set(zip(xs.tolist(), ys.tolist()))
+
+    def _live_cells(self) -> Iterator[Tuple[int, int, float]]:
+        """Iterate over (x, y, value) for every cell holding pheromone"""
+        ys, xs = np.nonzero(self.codes)
+        return zip(xs.tolist(), ys.tolist(), self._decode[self.codes[ys, xs]].tolist())
+
+    def _gather(self, xs: np.ndarray, ys: np.ndarray) -> np.ndarray:
+        """Get pheromone values at many positions, 0.0 outside the map"""
+        values = np.zeros(len(xs), dtype=np.float64)
+        inside = (xs >= 0) & (xs < self.width) & (ys >= 0) & (ys < self.height)
+        values[inside] = self._decode[self.codes[ys[inside], xs[inside]]]
+        return values
+
+
+def diffuse_array(values: np.ndarray, rate: float, open_cells: np.ndarray) -> None:
+    """
+    Apply one explicit diffusion step in place to a (height, width) array.
+
+    Each pair of adjacent open cells exchanges rate / 4 of the difference
+    between their values, so pheromone is conserved and never crosses a
+    closed cell or the map border. Rates up to 1 are stable. Values left
+    below the evaporation cutoff are dropped. Only the bounding box of the
+    live cells, grown by one cell, is processed.
+    """
+    live_rows = np.flatnonzero(values.any(axis=1))
+    if not live_rows.size:
+        return
+    live_cols = np.flatnonzero(values.any(axis=0))
+    rows = slice(max(live_rows[0] - 1, 0), live_rows[-1] + 2)
+    cols = slice(max(live_cols[0] - 1, 0), live_cols[-1] + 2)
+
+    region = values[rows, cols]
+    is_open = open_cells[rows, cols]
+    region *= is_open
+    share = rate / 4
+
+    # Flux between horizontal and vertical neighbours, zero across closed cells
+    flux_x = np.diff(region, axis=1)
+    flux_x *= share * (is_open[:, 1:] & is_open[:, :-1])
+    flux_y = np.diff(region, axis=0)
+    flux_y *= share * (is_open[1:, :] & is_open[:-1, :])
+
+    region[:, :-1] += flux_x
+    region[:, 1:] -= flux_x
+    region[:-1, :] += flux_y
+    region[1:, :] -= flux_y
+    np.putmask(region, region < EVAPORATION_CUTOFF, 0.0)
+
+
+def new_region_versions(width: int, height: int) -> np.ndarray:
+    """Zeroed change counters for the VERSION_REGION_SIZE regions of a map"""
+    size = VERSION_REGION_SIZE
+    return np.zeros((-(-height // size), -(-width // size)), dtype=np.int64)
+
+
+def region_stamp(versions: np.ndarray, x: int, y: int, radius: int) -> int:
+    """
+    Sum of the region counters overlapping the square within radius of (x, y).
+    Counters only grow, so the sum changes whenever any of them does.
+    """
+    size = VERSION_REGION_SIZE
+    top, left = max(y - radius, 0) // size, max(x - radius, 0) // size
+    bottom, right = (y + radius) // size + 1, (x + radius) // size + 1
+    return int(versions[top:bottom, left:right].sum())
+
+
+def read_region(
+    array: np.ndarray, left: int, top: int, width: int, height: int, fill
+) -> np.ndarray:
+    """
+    Read a (height, width) block of a [y, x] indexed array.
+
+    Blocks that lie inside the array are returned as a read-only view without
+    copying. Otherwise a new array is returned, with cells outside the array
+    set to fill.
+    """
+    rows, cols = array.shape
+    if left >= 0 and top >= 0 and left + width <= cols and top + height <= rows:
+        view = array[top : top + height, left : left + width]
+        view.flags.writeable = False
+        return view
+
+    region = np.full((height, width), fill, dtype=array.dtype)
+    x0, y0 = max(left, 0), max(top, 0)
+    x1, y1 = min(left + width, cols), min(top + height, rows)
+    if x0 < x1 and y0 < y1:
+        region[y0 - top : y1 - top, x0 - left : x1 - left] = array[y0:y1, x0:x1]
+    return region
+
+
+def direction_towards(dx: int, dy: int) -> Direction:
+    """Get the Direction closest to the (dx, dy) offset, which must be non-zero"""
+    # Clockwise angle from north, in eighths of a turn
+    eighths = math.atan2(dx, -dy) / (math.pi / 4)
+    return Direction(round(eighths) % 8)
+
+
+# Available pheromone storage backends, selectable by name
+PHEROMONE_BACKENDS = {
+    "dict": PheromoneMap,
+    "dense": DensePheromoneMap,
+    "lazy": LazyPheromoneMap,
+    "tiled": TiledPheromoneMap,
+    "quantized": QuantizedPheromoneMap,
+}
+
+# With "auto", maps with at least this many cells use the dense backend
+DENSE_BACKEND_MIN_CELLS = 100 * 100
+# and maps with at least this many cells use the tiled backend
+TILED_BACKEND_MIN_CELLS = 2048 * 2048
+
+
+def resolve_pheromone_backend(backend: str, width: int, height: int) -> str:
+    """Resolve "auto" to a concrete backend name for the given map size"""
+    if backend == "auto":
+        cells = width * height
+        if cells >= TILED_BACKEND_MIN_CELLS:
+            return "tiled"
+        return "dense" if cells >= DENSE_BACKEND_MIN_CELLS else "dict"
+    if backend not in PHEROMONE_BACKENDS:
+        raise ValueError(
+            f"Unknown pheromone backend: {backend} "
+            f"(expected auto or one of {', '.join(PHEROMONE_BACKENDS)})"
+        )
+    return backend
+
+
+def create_pheromone_map(
+    width: int,
+    height: int,
+    backend: str = "dict",
+    evaporation_rate: float = 0.999,
+    track_changes: bool = True,
+    pyramid: bool = False,
+) -> PheromoneMap:
+    """Create a pheromone map using the named storage backend"""
+    backend = resolve_pheromone_backend(backend, width, height)
+    pheromone_map = PHEROMONE_BACKENDS[backend](
+        width, height, evaporation_rate, track_changes=track_changes
+    )
+    if pyramid:
+        pheromone_map.enable_pyramid()
+    return pheromone_map
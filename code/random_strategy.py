@@ -1,7 +1,12 @@
 import random
+import numpy as np
 from environment import TerrainType, AntPerception
 from ant import AntAction, AntStrategy
 
+# Actions by value, for turning action codes back into AntAction members
+ACTIONS = tuple(AntAction)
+PHEROMONE_ACTIONS = (AntAction.DEPOSIT_HOME_PHEROMONE, AntAction.DEPOSIT_FOOD_PHEROMONE)
+
 
 class RandomStrategy(AntStrategy):
     """
@@ -15,6 +20,9 @@ class RandomStrategy(AntStrategy):
     - Always deposits pheromones after each step (home when searching, food when returning)
     """
 
+    # Only terrain is read, pheromones and other ants are ignored
+    perception_fields = ("visible_cells",)
+
     def __init__(self):
         """Initialize the strategy with last action tracking"""
         # Track the last action to alternate between movement and pheromone deposit
@@ -37,10 +45,7 @@ class RandomStrategy(AntStrategy):
             return AntAction.PICK_UP_FOOD
 
         # Priority 2: Drop food if at colony and carrying food
-        if (
-            perception.has_food
-            and TerrainType.COLONY in perception.visible_cells.values()
-        ):
+        if perception.has_food and perception.can_see_colony():
             for pos, terrain in perception.visible_cells.items():
                 if terrain == TerrainType.COLONY:
                     if pos == (0, 0):  # Directly on colony
@@ -65,6 +70,68 @@ class RandomStrategy(AntStrategy):
         self.ants_last_action[ant_id] = action
         return action
 
+    def pop_ant_state(self, ant_id: int):
+        """The ant's last action, which decides whether it deposits next"""
+        return self.ants_last_action.pop(ant_id, None)
+
+    def push_ant_state(self, ant_id: int, state) -> None:
+        if state is not None:
+            self.ants_last_action[ant_id] = state
+
+    def decide_actions(self, batch) -> np.ndarray:
+        """
+        Decide the actions of all ants of a StrategyBatch at once, with the
+        same priorities and random draws as decide_action for each ant
+        """
+        ant_ids = batch.ant_ids
+        has_food = batch.has_food
+
+        # Priorities 1 and 2: pick up food or drop it at the colony
+        picking = ~has_food & (batch.current_terrain == TerrainType.FOOD.value)
+        dropping = has_food & (batch.current_terrain == TerrainType.COLONY.value)
+
+        # Ants that dropped pheromone last move now, the others deposit
+        moving = np.array(
+            [
+                self.ants_last_action.get(ant_id) in PHEROMONE_ACTIONS
+                for ant_id in ant_ids
+            ],
+            dtype=bool,
+        )
+        actions = np.where(
+            has_food,
+            AntAction.DEPOSIT_FOOD_PHEROMONE.value,
+            AntAction.DEPOSIT_HOME_PHEROMONE.value,
+        ).astype(np.int8)
+        actions[moving] = AntAction.MOVE_FORWARD.value
+
+        # Food or colony ahead is walked towards, otherwise the move is random
+        def ahead(offset):
+            return offset[1] > 0
+
+        goal_ahead = np.where(
+            has_food,
+            batch.sees(TerrainType.COLONY, ahead),
+            batch.sees(TerrainType.FOOD, ahead),
+        )
+        wandering = np.flatnonzero(moving & ~goal_ahead & ~picking & ~dropping)
+        # Drawn in ant order, so the results match decide_action
+        choices = np.array([random.random() for _ in range(len(wandering))])
+        actions[wandering] = np.where(
+            choices < 0.6,
+            AntAction.MOVE_FORWARD.value,
+            np.where(
+                choices < 0.8, AntAction.TURN_LEFT.value, AntAction.TURN_RIGHT.value
+            ),
+        )
+
+        actions[picking] = AntAction.PICK_UP_FOOD.value
+        actions[dropping] = AntAction.DROP_FOOD.value
+        self.ants_last_action.update(
+            zip(ant_ids, [ACTIONS[code] for code in actions.tolist()])
+        )
+        return actions
+
     def _decide_movement(self, perception: AntPerception) -> AntAction:
         """Decide which direction to move based on current state"""
 
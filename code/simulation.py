@@ -5,7 +5,8 @@ import time
 import sys
 
 from environment import Environment
-from utils import create_environment, add_ants
+from utils import create_environment, add_ants, format_perception_usage
+from pheromones import PHEROMONE_BACKENDS
 
 
 class SimulationRunner:
@@ -58,7 +59,7 @@ class SimulationRunner:
                 completion_pct = (
                     (food_collected / initial_food * 100) if initial_food > 0 else 0
                 )
-                ants_with_food = sum(1 for ant in self.environment.ants if ant.has_food)
+                ants_with_food = self.environment.population.count_with_food()
 
                 print(
                     f"Step {self.step_count}: "
@@ -171,12 +172,62 @@ def main():
         help="Time limit for simulation (in seconds) (default: 0, no limit) - command line value takes precedence over environment file",
     )
     parser.add_argument("--quiet", action="store_true", help="Suppress progress output")
+    parser.add_argument(
+        "--pheromone-backend",
+        type=str,
+        choices=["auto", *PHEROMONE_BACKENDS],
+        default="auto",
+        help="Pheromone storage backend (auto picks one from the map size) (default: auto)",
+    )
+    parser.add_argument(
+        "--batch-deposits",
+        action="store_true",
+        help="Apply pheromone deposits once at the end of each step instead of immediately",
+    )
+    parser.add_argument(
+        "--batch-perception",
+        action="store_true",
+        help="Compute the perception of all ants together at the start of each step",
+    )
+    parser.add_argument(
+        "--lazy-perception",
+        action="store_true",
+        help="Build perception fields only when a strategy reads them",
+    )
+    parser.add_argument(
+        "--pooled-perception",
+        action="store_true",
+        help="Reuse compact perception objects across steps instead of allocating new ones",
+    )
+    parser.add_argument(
+        "--incremental-perception",
+        action="store_true",
+        help="Reuse the perception of ants that did not move, refreshing only what changed",
+    )
+    parser.add_argument(
+        "--perception-threads",
+        type=int,
+        default=1,
+        help="Threads building the ants' perceptions in parallel (default: 1, serial)",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Worker processes deciding the ants' actions in parallel (default: 1, serial)",
+    )
 
     args = parser.parse_args()
 
     try:
         environment = create_environment(
-            args.env, args.width, args.height, verbose=not args.quiet
+            args.env,
+            args.width,
+            args.height,
+            verbose=not args.quiet,
+            pheromone_backend=args.pheromone_backend,
+            # Nothing drains pheromone changes without a renderer
+            track_pheromone_changes=False,
         )
 
         # Check if environment file specified a number of ants
@@ -213,6 +264,14 @@ def main():
             if not args.quiet:
                 print(f"Using max steps from environment file: {max_steps} steps")
 
+        environment.batch_deposits = args.batch_deposits
+        environment.batch_perception = args.batch_perception
+        environment.lazy_perception = args.lazy_perception
+        environment.pooled_perception = args.pooled_perception
+        environment.incremental_perception = args.incremental_perception
+        environment.perception_threads = args.perception_threads
+        environment.decision_workers = args.workers
+
         add_ants(
             environment,
             args.strategy,
@@ -227,13 +286,18 @@ def main():
             time_limit=time_limit,
         )
 
-        result = runner.run(verbose=not args.quiet)
+        try:
+            result = runner.run(verbose=not args.quiet)
+        finally:
+            environment.stop_workers()
 
         if not args.quiet:
             print(f"\nSimulation completed in {result['steps']} steps")
             print(
                 f"Food collected: {environment.food_collected}/{environment.initial_food_amount} ({result['completion_percentage']:.1f}%)"
             )
+            if environment.lazy_perception:
+                print(format_perception_usage(environment))
 
         # Return the result dictionary instead of an integer
         return result
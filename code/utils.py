@@ -2,6 +2,7 @@ import os.path
 import importlib.util
 import inspect
 import random
+import sys
 from typing import Optional, Type
 
 from environment import Environment, EnvironmentBuilder
@@ -21,6 +22,8 @@ def load_strategy_from_file(filepath: str, verbose: bool = True) -> Type[AntStra
         raise ValueError(f"Could not load module from {filepath}")
 
     module = importlib.util.module_from_spec(spec)
+    # Registered so strategy objects can be pickled, e.g. for worker processes
+    sys.modules[module_name] = module
     spec.loader.exec_module(module)
 
     strategy_classes = []
@@ -40,26 +43,51 @@ def load_strategy_from_file(filepath: str, verbose: bool = True) -> Type[AntStra
 
 
 def create_environment(
-    env_type: str, width: int, height: int, verbose: bool = True
+    env_type: str,
+    width: int,
+    height: int,
+    verbose: bool = True,
+    pheromone_backend: str = "auto",
+    track_pheromone_changes: bool = True,
 ) -> Environment:
     if env_type == "simple":
-        return EnvironmentBuilder.create_simple(width, height)
+        env = EnvironmentBuilder.create_simple(width, height)
     elif env_type == "obstacle":
-        return EnvironmentBuilder.create_obstacle_course(width, height)
+        env = EnvironmentBuilder.create_obstacle_course(width, height)
     elif env_type == "maze":
-        return EnvironmentBuilder.create_maze(width, height)
+        env = EnvironmentBuilder.create_maze(width, height)
     elif env_type == "empty":
-        return EnvironmentBuilder.create_empty(width, height)
+        env = EnvironmentBuilder.create_empty(width, height)
     elif os.path.isfile(env_type):
         try:
-            return EnvironmentBuilder.load_from_file(env_type, verbose=verbose)
+            env = EnvironmentBuilder.load_from_file(env_type, verbose=verbose)
         except Exception as e:
             raise ValueError(
                 f"Failed to load environment from file {env_type}: {str(e)}"
             )
+        if env is None:
+            raise ValueError(f"Failed to load environment from file {env_type}")
     else:
         raise ValueError(f"Unknown environment type: {env_type}")
 
+    # Pick the pheromone storage now that the map size is known
+    env.set_pheromone_backend(pheromone_backend, track_pheromone_changes)
+    if verbose:
+        print(f"Using {env.pheromone_backend} pheromone backend")
+    return env
+
+
+def format_perception_usage(environment: Environment) -> str:
+    """Describe how often each lazily built perception field was read"""
+    usage = environment.perception_usage
+    perceptions = usage["perceptions"]
+    fields = ", ".join(
+        f"{name} {count / perceptions * 100 if perceptions else 0:.1f}%"
+        for name, count in usage.items()
+        if name != "perceptions"
+    )
+    return f"Perception fields read ({perceptions} perceptions): {fields}"
+
 
 def add_ants(
     environment: Environment,
@@ -101,5 +129,12 @@ def add_ants(
         x, y = colony_pos
         # Create ant with random initial direction
         direction = random.choice(list(Direction))
-        ant = Ant(x, y, direction, strategy, ant_id=i + 1)
+        ant = Ant(
+            x,
+            y,
+            direction,
+            strategy,
+            ant_id=i + 1,
+            population=environment.population,
+        )
         environment.add_ant(ant)